@@ -0,0 +1,85 @@
+# analysis_cache.py
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+from cache import TTLCache
+
+
+class AnalysisCache:
+    """Image-analysis results keyed by image SHA-256.
+
+    Hot entries live in an in-memory LRU; every result is also written to a
+    local SQLite file so hits survive restarts. Entries are scoped to a
+    version key, so changing the scoring rules or endpoint starts afresh.
+    """
+
+    def __init__(self, path: str, version: str, maxsize: int = 10000, ttl: float = 30 * 86400):
+        self.path = path
+        self.version = version
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_results ("
+                " sha256 TEXT NOT NULL, version TEXT NOT NULL,"
+                " score INTEGER NOT NULL, caption TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (sha256, version))"
+            )
+            # Drop rows from older scoring versions and expired rows
+            conn.execute(
+                "DELETE FROM analysis_results WHERE version != ? OR created_at < ?",
+                (self.version, time.time() - self.ttl),
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def peek(self, digest: str) -> Optional[Tuple[int, str]]:
+        """In-memory lookup only; never touches the disk"""
+        return self.memory.get(digest)
+
+    def load(self, digest: str) -> Optional[Tuple[int, str]]:
+        """Look the result up on disk after a peek() miss, keeping it in memory on a hit"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT score, caption FROM analysis_results"
+                " WHERE sha256 = ? AND version = ? AND created_at >= ?",
+                (digest, self.version, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        hit = (row[0], row[1])
+        self.memory.set(digest, hit)
+        return hit
+
+    def set(self, digest: str, score: int, caption: str) -> None:
+        self.memory.set(digest, (score, caption))
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_results (sha256, version, score, caption, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (digest, self.version, score, caption, time.time()),
+            )
+            conn.commit()
+
+    def stats(self) -> dict:
+        return {
+            **self.memory.stats(),
+            "version": self.version,
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+        }
@@ -0,0 +1,196 @@
+# analytics.py
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import get_db, Attendance, AttendanceRollup, User, UserRole
+from auth import get_current_user
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# Columns the attendance summary can be grouped by
+GROUP_COLUMNS = {
+    "district": Attendance.district,
+    "subject": Attendance.subject,
+    "school": User.school,
+}
+
+ROLLUP_GROUP_COLUMNS = {
+    "district": AttendanceRollup.district,
+    "subject": AttendanceRollup.subject,
+    "school": AttendanceRollup.school,
+}
+
+# Row id used to derive the masked label of a group (same ids as list_attendance)
+MASK_ID_COLUMNS = {
+    "district": Attendance.id,
+    "school": User.id,
+}
+
+# The same ids as kept on the rollup rows
+ROLLUP_MASK_ID_COLUMNS = {
+    "district": AttendanceRollup.min_attendance_id,
+    "school": AttendanceRollup.min_user_id,
+}
+
+
+def mask_group_label(group_by: str, label, mask_id):
+    """Replace a group label with a pseudonym derived from the group's lowest row id.
+
+    Ids are unique per group, so labels never collide (no modulo, unlike the
+    per-row District-NN pseudonym of list_attendance).
+    """
+    if group_by == "district":
+        return f"DIST-{mask_id:02d}"
+    if group_by == "school":
+        return f"SCH-{mask_id:04d}"
+    return label
+
+
+def attendance_rate(present: int, absent: int):
+    total = present + absent
+    return round(present / total, 4) if total else None
+
+
+@router.get("/attendance")
+def attendance_summary(
+    group_by: str = Query("district", pattern="^(district|subject|school)$"),
+    top_reasons: int = Query(3, ge=0, le=20),
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Aggregate attendance totals, rates and top absence reasons per group.
+
+    from/to limit the aggregate to the created_at window [from, to); rows
+    without a created_at (submitted before it existed) are left out.
+    """
+    try:
+        key = GROUP_COLUMNS[group_by]
+        mask = current_user["role"] in [UserRole.FIELDWORKER, UserRole.MANAGER]
+
+        window = []
+        if created_from is not None:
+            window.append(Attendance.created_at >= created_from)
+        if created_to is not None:
+            window.append(Attendance.created_at < created_to)
+
+        columns = [
+            key.label("label"),
+            func.count(Attendance.id).label("records"),
+            func.coalesce(func.sum(Attendance.students_present), 0).label("students_present"),
+            func.coalesce(func.sum(Attendance.students_absent), 0).label("students_absent"),
+        ]
+        if group_by in MASK_ID_COLUMNS:
+            columns.append(func.min(MASK_ID_COLUMNS[group_by]).label("mask_id"))
+
+        totals = (
+            db.query(*columns)
+            .join(User, Attendance.phone == User.phone)
+            .filter(*window)
+            .group_by(key)
+            .order_by(key)
+            .all()
+        )
+
+        reasons = defaultdict(list)
+        if top_reasons:
+            # absence_reason is free text: rank inside the database so only the
+            # top N reasons per group are returned, not every distinct one
+            ranked = (
+                db.query(
+                    key.label("label"),
+                    Attendance.absence_reason.label("reason"),
+                    func.count(Attendance.id).label("count"),
+                    func.row_number().over(
+                        partition_by=key,
+                        order_by=(func.count(Attendance.id).desc(), Attendance.absence_reason)
+                    ).label("rank"),
+                )
+                .join(User, Attendance.phone == User.phone)
+                .filter(Attendance.absence_reason.isnot(None), Attendance.absence_reason != "", *window)
+                .group_by(key, Attendance.absence_reason)
+                .subquery()
+            )
+            reason_rows = (
+                db.query(ranked.c.label, ranked.c.reason, ranked.c.count)
+                .filter(ranked.c.rank <= top_reasons)
+                .order_by(ranked.c.label, ranked.c.rank)
+                .all()
+            )
+            for label, reason, count in reason_rows:
+                reasons[label].append({"reason": reason, "count": count})
+
+        groups = []
+        for row in totals:
+            label = row.label
+            if mask:
+                label = mask_group_label(group_by, row.label, getattr(row, "mask_id", None))
+            groups.append({
+                "group": label,
+                "records": row.records,
+                "students_present": row.students_present,
+                "students_absent": row.students_absent,
+                "attendance_rate": attendance_rate(row.students_present, row.students_absent),
+                "top_absence_reasons": reasons.get(row.label, []),
+            })
+
+        return {"group_by": group_by, "groups": groups}
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute attendance analytics"
+        )
+
+
+@router.get("/attendance/summary")
+def attendance_rollup_summary(
+    group_by: str = Query("district", pattern="^(district|subject|school)$"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """All-time attendance totals per group read from the rollup table (O(groups))"""
+    try:
+        key = ROLLUP_GROUP_COLUMNS[group_by]
+        mask = current_user["role"] in [UserRole.FIELDWORKER, UserRole.MANAGER]
+
+        columns = [
+            key.label("label"),
+            func.sum(AttendanceRollup.records).label("records"),
+            func.sum(AttendanceRollup.students_present).label("students_present"),
+            func.sum(AttendanceRollup.students_absent).label("students_absent"),
+        ]
+        if group_by in ROLLUP_MASK_ID_COLUMNS:
+            columns.append(func.min(ROLLUP_MASK_ID_COLUMNS[group_by]).label("mask_id"))
+
+        totals = (
+            db.query(*columns)
+            .group_by(key)
+            .order_by(key)
+            .all()
+        )
+
+        groups = []
+        for row in totals:
+            label = row.label
+            if mask:
+                label = mask_group_label(group_by, row.label, getattr(row, "mask_id", None))
+            groups.append({
+                "group": label,
+                "records": row.records,
+                "students_present": row.students_present,
+                "students_absent": row.students_absent,
+                "attendance_rate": attendance_rate(row.students_present, row.students_absent),
+            })
+
+        return {"group_by": group_by, "groups": groups}
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to read attendance summary"
+        )
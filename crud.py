@@ -1,11 +1,23 @@
+from sqlalchemy import and_, insert, or_
 from sqlalchemy.orm import Session
 from models import User, Attendance
 from schemas import UserCreate, AttendanceCreate
 from models import ExportRequest
 from schemas import ExportRequestCreate
 from datetime import datetime, timezone
+from typing import List
 from models import LessonPlan
 from schemas import LessonPlanCreate
+from rollup import apply_attendance_rollup
+from versions import bump_version
+from cache import TTLCache
+import schemas
+import os
+
+# Per-process cache for the hottest mobile lookup; create_user invalidates it
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # seconds
+user_by_phone_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
 def create_user(db: Session, user: UserCreate):
     db_user = db.query(User).filter(User.phone == user.phone).first()
@@ -14,35 +26,127 @@ def create_user(db: Session, user: UserCreate):
     
     new_user = User(**user.dict())
     db.add(new_user)
+    db.flush()
+    # Attendance sent before the teacher registered was left out of the rollup;
+    # it joins to this user from now on, so fold it in with the same commit
+    earlier = db.query(Attendance).filter(Attendance.phone == new_user.phone).all()
+    apply_attendance_rollup(db, earlier)
+    bump_version(db, "users")
     db.commit()
     db.refresh(new_user)
+    user_by_phone_cache.invalidate(new_user.phone)
     return new_user
 
 
 def create_attendance(db: Session, attendance: AttendanceCreate):
     db_att = Attendance(**attendance.dict())
     db.add(db_att)
+    db.flush()
+    apply_attendance_rollup(db, [db_att])
+    bump_version(db, "attendance")
     db.commit()
     db.refresh(db_att)
     return db_att
 
+def create_attendance_bulk(db: Session, attendances: List[AttendanceCreate]) -> List[int]:
+    """Insert many attendance records in one multi-row INSERT and one commit.
+
+    Returns the new ids in the same order as the input records.
+    """
+    if not attendances:
+        return []
+    stmt = insert(Attendance).returning(Attendance.id, sort_by_parameter_order=True)
+    ids = db.execute(stmt, [attendance.dict() for attendance in attendances]).scalars().all()
+    apply_attendance_rollup(db, attendances, ids)
+    bump_version(db, "attendance")
+    db.commit()
+    return ids
+
 def get_users(db: Session):
     return db.query(User).all()
 
 def get_attendance(db: Session):
     return db.query(Attendance).all()
 
+def attendance_with_users_query(
+    db: Session,
+    columns: list,
+    after_id: int = None,
+    district: str = None,
+    subject: str = None,
+    phone: str = None,
+    created_from: datetime = None,
+    created_to: datetime = None
+):
+    """Attendance joined to users ordered by attendance id, optionally filtered.
+
+    columns is the projection to select (see masking.attendance_columns).
+    The time window is [created_from, created_to).
+    """
+    query = db.query(*columns).select_from(Attendance).join(User, Attendance.phone == User.phone)
+    if after_id is not None:
+        query = query.filter(Attendance.id > after_id)
+    if created_from is not None:
+        query = query.filter(Attendance.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(Attendance.created_at < created_to)
+    if district:
+        query = query.filter(Attendance.district == district)
+    if subject:
+        query = query.filter(Attendance.subject == subject)
+    if phone:
+        query = query.filter(Attendance.phone == phone)
+    return query.order_by(Attendance.id)
+
+def get_attendance_page(
+    db: Session,
+    columns: list,
+    limit: int = 100,
+    after_id: int = None,
+    district: str = None,
+    subject: str = None,
+    phone: str = None,
+    created_from: datetime = None,
+    created_to: datetime = None
+):
+    """Keyset page of attendance rows ordered by attendance id"""
+    query = attendance_with_users_query(
+        db, columns, after_id=after_id, district=district, subject=subject, phone=phone,
+        created_from=created_from, created_to=created_to
+    )
+    return query.limit(limit).all()
+
 
 
 def get_user_by_phone(db: Session, phone: str):
     return db.query(User).filter(User.phone == phone).first()
 
+def get_user_by_phone_cached(db: Session, phone: str):
+    """Detached snapshot (schemas.User) of the user with this phone, or None.
+
+    Unregistered phones are not cached so a new registration shows up at once.
+    """
+    user = user_by_phone_cache.get(phone)
+    if user is None:
+        db_user = get_user_by_phone(db, phone)
+        if db_user is None:
+            return None
+        user = schemas.User.model_validate(db_user)
+        user_by_phone_cache.set(phone, user)
+    return user
+
+def cache_stats() -> dict:
+    return {
+        "user_by_phone": user_by_phone_cache.stats(),
+    }
+
 
 
 
 def create_export_request(db: Session, export_request: ExportRequestCreate):
     db_export_request = ExportRequest(**export_request.dict())
     db.add(db_export_request)
+    bump_version(db, "export_requests")
     db.commit()
     db.refresh(db_export_request)
     return db_export_request
@@ -60,25 +164,7 @@ def update_export_request_status(db: Session, request_id: int, status: str, appr
         if status == "approved":
             db_request.approved_by = approved_by
             db_request.approved_at = datetime.now(timezone.utc)
-        db.commit()
-        db.refresh(db_request)
-    return db_request
-
-def get_user_approved_requests(db: Session, user_id: int):
-    return db.query(ExportRequest).filter(
-        ExportRequest.requester_id == user_id,
-        ExportRequest.status == "approved"
-    ).all()
-
-
-
-def update_export_request_status(db: Session, request_id: int, status: str, approved_by: str = None):
-    db_request = db.query(ExportRequest).filter(ExportRequest.id == request_id).first()
-    if db_request:
-        db_request.status = status
-        if status == "approved":
-            db_request.approved_by = approved_by
-            db_request.approved_at = datetime.now(timezone.utc)
+        bump_version(db, "export_requests")
         db.commit()
         db.refresh(db_request)
     return db_request
@@ -100,6 +186,39 @@ def create_lesson_plan(db: Session, lesson_plan: LessonPlanCreate):
     """Create a new lesson plan record with original image reference"""
     db_lesson_plan = LessonPlan(**lesson_plan.dict())
     db.add(db_lesson_plan)
+    bump_version(db, "lesson_plans")
     db.commit()
     db.refresh(db_lesson_plan)
-    return db_lesson_plan
\ No newline at end of file
+    return db_lesson_plan
+
+def get_school_lesson_plans_page(
+    db: Session,
+    school: str,
+    limit: int = 50,
+    before: tuple = None,
+    subject: str = None,
+    min_score: int = None,
+    max_score: int = None
+):
+    """Keyset page of (LessonPlan, User) rows for one school, newest first.
+
+    before is the (created_at, id) of the last row of the previous page.
+    """
+    query = (
+        db.query(LessonPlan, User)
+        .join(User, LessonPlan.phone == User.phone)
+        .filter(User.school == school)
+    )
+    if before is not None:
+        created_at, last_id = before
+        query = query.filter(or_(
+            LessonPlan.created_at < created_at,
+            and_(LessonPlan.created_at == created_at, LessonPlan.id < last_id)
+        ))
+    if subject:
+        query = query.filter(LessonPlan.subject == subject)
+    if min_score is not None:
+        query = query.filter(LessonPlan.score >= min_score)
+    if max_score is not None:
+        query = query.filter(LessonPlan.score <= max_score)
+    return query.order_by(LessonPlan.created_at.desc(), LessonPlan.id.desc()).limit(limit).all()
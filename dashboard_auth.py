@@ -3,10 +3,13 @@ import time
 import os
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from jose import jwt
-from models import SessionLocal, DashboardUser as DashboardUserModel, UserRole
+from models import get_db, get_async_db, DashboardUser as DashboardUserModel, UserRole
 from dashboard_schemas import (
     PhoneRequest, OTPRequest, DashboardUserCreate, 
     DashboardUser as DashboardUserSchema, LoginRequest, LoginVerifyRequest
@@ -22,13 +25,6 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="dashboard/login")
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 def create_access_token(data: dict):
     """Create JWT access token"""
@@ -37,37 +33,38 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+async def get_dashboard_user_by_phone(db: AsyncSession, phone: str):
+    """Look up a dashboard user by phone on the async session"""
+    result = await db.execute(select(DashboardUserModel).where(DashboardUserModel.phone == phone))
+    return result.scalars().first()
+
 @router.post("/send-registration-otp")
-async def send_registration_otp(phone_request: PhoneRequest, db: Session = Depends(get_db)):
+async def send_registration_otp(phone_request: PhoneRequest, db: AsyncSession = Depends(get_async_db)):
     """Send OTP for registration"""
-    existing_user = db.query(DashboardUserModel).filter(
-        DashboardUserModel.phone == phone_request.phone
-    ).first()
+    existing_user = await get_dashboard_user_by_phone(db, phone_request.phone)
 
     if existing_user:
         raise HTTPException(status_code=400, detail="User with this phone number already exists")
 
-    result = send_otp(phone_request.phone)
+    result = await run_in_threadpool(send_otp, phone_request.phone)
     if "successfully" not in result.lower():
         raise HTTPException(status_code=500, detail=result)
 
     return {"message": "OTP sent successfully"}
 
 @router.post("/verify-registration-otp")
-async def verify_registration_otp(otp_request: OTPRequest, db: Session = Depends(get_db)):
+async def verify_registration_otp(otp_request: OTPRequest, db: AsyncSession = Depends(get_async_db)):
     """Verify OTP for registration"""
-    if not verify_otp(otp_request.phone, otp_request.otp):
+    if not await run_in_threadpool(verify_otp, otp_request.phone, otp_request.otp):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     return {"verified": True}
 
 # --------------------- User Registration ---------------------
 @router.post("/register", response_model=DashboardUserSchema)
-async def register_user(user_data: DashboardUserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: DashboardUserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new dashboard user"""
-    existing_user = db.query(DashboardUserModel).filter(
-        DashboardUserModel.phone == user_data.phone
-    ).first()
+    existing_user = await get_dashboard_user_by_phone(db, user_data.phone)
     if existing_user:
         raise HTTPException(status_code=400, detail="User with this phone number already exists")
 
@@ -85,36 +82,32 @@ async def register_user(user_data: DashboardUserCreate, db: Session = Depends(ge
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     return db_user
 
 @router.post("/send-login-otp")
-async def send_login_otp(login_request: LoginRequest, db: Session = Depends(get_db)):
+async def send_login_otp(login_request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Send OTP for login"""
-    user = db.query(DashboardUserModel).filter(
-        DashboardUserModel.phone == login_request.phone
-    ).first()
+    user = await get_dashboard_user_by_phone(db, login_request.phone)
     if not user:
         raise HTTPException(status_code=404, detail="User not found. Please register first.")
 
-    result = send_otp(login_request.phone)
+    result = await run_in_threadpool(send_otp, login_request.phone)
     if "successfully" not in result.lower():
         raise HTTPException(status_code=500, detail=result)
 
     return {"message": "OTP sent successfully"}
 
 @router.post("/login")
-async def login(login_verify: LoginVerifyRequest, db: Session = Depends(get_db)):
+async def login(login_verify: LoginVerifyRequest, db: AsyncSession = Depends(get_async_db)):
     """Login user with OTP verification"""
-    user = db.query(DashboardUserModel).filter(
-        DashboardUserModel.phone == login_verify.phone
-    ).first()
+    user = await get_dashboard_user_by_phone(db, login_verify.phone)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not verify_otp(login_verify.phone, login_verify.otp):
+    if not await run_in_threadpool(verify_otp, login_verify.phone, login_verify.otp):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     # Create JWT token with user info
@@ -160,7 +153,7 @@ def get_dashboard_user(
 @router.post("/send-export-otp")
 async def send_export_otp(
     request_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Send OTP for data export verification (for managers)"""
@@ -176,7 +169,7 @@ async def send_export_otp(
         if not phone:
             raise HTTPException(status_code=400, detail="Phone number is required")
         
-        result = send_otp(phone)
+        result = await run_in_threadpool(send_otp, phone)
         if "successfully" not in result.lower():
             raise HTTPException(status_code=500, detail=result)
 
@@ -188,7 +181,7 @@ async def send_export_otp(
 @router.post("/verify-export-otp")
 async def verify_export_otp(
     request_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Verify OTP for data export (for managers)"""
@@ -203,7 +196,7 @@ async def verify_export_otp(
         if not phone or not otp:
             raise HTTPException(status_code=400, detail="Phone and OTP are required")
         
-        if not verify_otp(phone, otp):
+        if not await run_in_threadpool(verify_otp, phone, otp):
             raise HTTPException(status_code=400, detail="Invalid OTP")
         
         # Create a temporary token for data access
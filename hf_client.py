@@ -0,0 +1,181 @@
+# hf_client.py
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+HF_ENDPOINT = os.getenv("HF_ENDPOINT")
+HF_TOKEN = os.getenv("HF_TOKEN")
+
+HF_TIMEOUT_SECONDS = float(os.getenv("HF_TIMEOUT_SECONDS", "30"))
+# Requests in flight to the endpoint at once; also the keep-alive pool size
+HF_MAX_CONCURRENCY = int(os.getenv("HF_MAX_CONCURRENCY", "4"))
+# Retries after a 429, waiting HF_BACKOFF_SECONDS * 2**attempt (or Retry-After)
+HF_MAX_RETRIES = int(os.getenv("HF_MAX_RETRIES", "3"))
+HF_BACKOFF_SECONDS = float(os.getenv("HF_BACKOFF_SECONDS", "1"))
+# Longest wait honoured; a longer Retry-After gives up at once (callers use the fallback)
+HF_MAX_RETRY_DELAY_SECONDS = HF_BACKOFF_SECONDS * 2 ** HF_MAX_RETRIES
+# Consecutive failures that open the breaker, and how long it stays open
+HF_BREAKER_FAILURES = int(os.getenv("HF_BREAKER_FAILURES", "5"))
+HF_BREAKER_RESET_SECONDS = float(os.getenv("HF_BREAKER_RESET_SECONDS", "60"))
+
+
+class HFUnavailable(Exception):
+    """The endpoint failed, timed out, or the circuit breaker is open"""
+
+
+class HFRateLimited(Exception):
+    """The endpoint kept answering 429 after every retry"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after the reset timeout one trial call is let through"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        self.trial_in_flight = False
+
+
+class HuggingFaceClient:
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(HF_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(HF_BREAKER_FAILURES, HF_BREAKER_RESET_SECONDS)
+        self._requests = 0
+        self._retries = 0
+        self._rejected = 0
+        self._in_flight = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=HF_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=HF_MAX_CONCURRENCY,
+                    max_keepalive_connections=HF_MAX_CONCURRENCY,
+                ),
+                headers={"Authorization": f"Bearer {HF_TOKEN}"},
+            )
+        return self._client
+
+    async def caption(self, filename: str, image: bytes) -> str:
+        """Caption an image with the endpoint; raises HFUnavailable or HFRateLimited"""
+        if not HF_ENDPOINT:
+            raise HFUnavailable("HF_ENDPOINT is not configured")
+        is_trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            self._rejected += 1
+            raise HFUnavailable("circuit breaker open")
+
+        settled = False
+        try:
+            async with self._semaphore:
+                self._in_flight += 1
+                try:
+                    caption = await self._post(filename, image)
+                finally:
+                    self._in_flight -= 1
+        except HFRateLimited:
+            # Throttling says nothing about the endpoint's health
+            raise
+        except (httpx.HTTPError, ValueError) as e:
+            settled = True
+            self.breaker.record_failure()
+            raise HFUnavailable(str(e)) from e
+        else:
+            settled = True
+            self.breaker.record_success()
+        finally:
+            # A trial that was rate limited or cancelled must not hold the breaker open
+            if is_trial and not settled:
+                self.breaker.trial_in_flight = False
+        return caption
+
+    async def _post(self, filename: str, image: bytes) -> str:
+        client = self._get_client()
+        for attempt in range(HF_MAX_RETRIES + 1):
+            self._requests += 1
+            resp = await client.post(
+                HF_ENDPOINT,
+                files=[("data", (filename, image))],
+                data={"fn_index": 0},
+            )
+            if resp.status_code != 429:
+                resp.raise_for_status()
+                return resp.json().get("data", [""])[0]  # Adjust based on actual response format
+
+            if attempt == HF_MAX_RETRIES:
+                break
+            retry_after = resp.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else HF_BACKOFF_SECONDS * 2 ** attempt
+            if delay > HF_MAX_RETRY_DELAY_SECONDS:
+                # Waiting would hold a concurrency slot and starve other scoring calls
+                break
+            logger.warning(f"Rate limited by Hugging Face endpoint, retrying in {delay:.1f}s")
+            self._retries += 1
+            await asyncio.sleep(delay)
+        raise HFRateLimited("rate limited")
+
+    def metrics(self):
+        """Breaker state and request counters for the scoring endpoint"""
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "max_concurrency": HF_MAX_CONCURRENCY,
+            "in_flight": self._in_flight,
+            "requests": self._requests,
+            "retries": self._retries,
+            "rejected_while_open": self._rejected,
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Singleton instance
+hf_client = HuggingFaceClient()
@@ -0,0 +1,40 @@
+# imaging.py
+"""Resized WebP renditions of lesson plan images.
+
+Kept free of app imports: these functions run inside cpu_pool workers.
+"""
+import io
+import os
+from PIL import Image, ImageOps
+
+THUMBNAIL_MAX_PX = int(os.getenv("THUMBNAIL_MAX_PX", "240"))
+MEDIUM_MAX_PX = int(os.getenv("MEDIUM_MAX_PX", "1024"))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+
+# Rendition name -> longest side in pixels
+RENDITIONS = {
+    "thumb": THUMBNAIL_MAX_PX,
+    "medium": MEDIUM_MAX_PX,
+}
+
+
+def derivative_path(file_path: str, name: str) -> str:
+    """Key of a rendition stored next to the original, e.g. .../<uuid>_thumb.webp"""
+    return f"{os.path.splitext(file_path)[0]}_{name}.webp"
+
+
+def _webp(image: Image.Image, max_px: int) -> bytes:
+    rendition = image.copy()
+    rendition.thumbnail((max_px, max_px))
+    buffer = io.BytesIO()
+    rendition.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def render_derivatives(data: bytes) -> dict:
+    """Decode an image and return {rendition name: WebP bytes}"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        return {name: _webp(image, max_px) for name, max_px in RENDITIONS.items()}
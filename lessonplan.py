@@ -1,13 +1,26 @@
-import requests
+import aiofiles
+import asyncio
+import hashlib
 import shutil
 import os
-from datetime import datetime
-from fpdf import FPDF
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+import uuid
+from datetime import datetime, timedelta
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
-from typing import Optional, Tuple
+from typing import Tuple
+
+import schemas
+from analysis_cache import AnalysisCache
+from cpu_pool import run_cpu_bound
+from pdf_render import generate_pdf
+from file_responses import immutable_file_response
+from hf_client import HF_ENDPOINT, HFRateLimited, HFUnavailable, hf_client
+from models import AsyncSessionLocal, LessonPlanJob, get_async_db
+from storage_manager import GENERATED_DIR, UPLOAD_DIR, storage_manager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,51 +28,63 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-HF_ENDPOINT = os.getenv("HF_ENDPOINT")
-HF_TOKEN = os.getenv("HF_TOKEN")
+# Number of submissions analyzed / rendered at the same time
+LESSONPLAN_WORKERS = int(os.getenv("LESSONPLAN_WORKERS", "2"))
+# A job "running" for longer than this is assumed orphaned by a dead process
+LESSONPLAN_JOB_TIMEOUT_SECONDS = int(os.getenv("LESSONPLAN_JOB_TIMEOUT_SECONDS", "900"))
+
+# Caption keywords and the points each adds to the base score
+BASE_SCORE = 50
+SCORING_KEYWORDS = [("lesson", 20), ("plan", 10), ("handwritten", 10), ("table", 10)]
+
+# Cached results are only valid for the scoring rules and endpoint that produced them
+SCORING_VERSION = hashlib.sha256(
+    repr((BASE_SCORE, SCORING_KEYWORDS, HF_ENDPOINT)).encode()
+).hexdigest()[:16]
+
+analysis_cache = AnalysisCache(
+    os.getenv("ANALYSIS_CACHE_PATH", "lessonplans/analysis_cache.db"),
+    version=SCORING_VERSION,
+    maxsize=int(os.getenv("ANALYSIS_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 86400))),  # seconds
+)
 
 router = APIRouter()
 
-def analyze_image_score(image_path: str) -> Tuple[int, str]:
+job_queue: "asyncio.Queue[str]" = asyncio.Queue()
+_workers = []
+
+async def analyze_image_score(image_path: str, digest: str) -> Tuple[int, str]:
     """ 
-    Analyze lesson plan image using Hugging Face endpoint with improved error handling
-    Returns a tuple of (score, caption)
+    Analyze lesson plan image using the Hugging Face endpoint.
+    Returns a tuple of (score, caption); falls back to a basic score at once
+    while the endpoint is failing. Results are cached by the image's SHA-256
+    digest; fallback results are not.
     """
     try:
-        with open(image_path, "rb") as image_file:
-            files = [("data", (os.path.basename(image_path), image_file))]
-            headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-            payload = {"fn_index": 0}
-
-            # Add timeout to prevent hanging
-            resp = requests.post(
-                HF_ENDPOINT, 
-                headers=headers, 
-                files=files, 
-                data=payload,
-                timeout=30  # 30 seconds timeout
-            )
-        
-        # Check for rate limiting or service issues
-        if resp.status_code == 429:
-            logger.warning("Rate limited by Hugging Face endpoint")
-            return 50, "Basic lesson plan detected (rate limited)"
-            
-        resp.raise_for_status()
-        
-        res = resp.json()
-        caption = res.get("data", [""])[0]  # Adjust based on actual response format
+        cached = analysis_cache.peek(digest) or await run_in_threadpool(analysis_cache.load, digest)
+        if cached is not None:
+            return cached
+
+        async with aiofiles.open(image_path, "rb") as image_file:
+            image = await image_file.read()
+        caption = await hf_client.caption(os.path.basename(image_path), image)
 
         # Calculate score based on keywords
-        score = 50  # Base score
+        score = BASE_SCORE
         low = caption.lower()
-        for kw, pts in [("lesson", 20), ("plan", 10), ("handwritten", 10), ("table", 10)]:
+        for kw, pts in SCORING_KEYWORDS:
             if kw in low:
                 score += pts
+        score = min(score, 100)
+
+        await run_in_threadpool(analysis_cache.set, digest, score, caption)
+        return score, caption
         
-        return min(score, 100), caption
-        
-    except requests.exceptions.RequestException as e:
+    except HFRateLimited:
+        logger.warning("Rate limited by Hugging Face endpoint")
+        return 50, "Basic lesson plan detected (rate limited)"
+    except HFUnavailable as e:
         logger.error(f"Error calling Hugging Face endpoint: {e}")
         # Fallback basic analysis
         return 50, "Basic lesson plan detected (analysis service unavailable)"
@@ -67,83 +92,206 @@ def analyze_image_score(image_path: str) -> Tuple[int, str]:
         logger.error(f"Unexpected error in image analysis: {e}")
         return 50, "Basic lesson plan detected"
 
-def generate_pdf(
-    pdf_path: str,
-    teacher_name: str,
-    school: str,
-    caption: str,
-    image_path: Optional[str] = None
-) -> None:
-    """Generate PDF with lesson plan details"""
+def download_url_for(pdf_filename: str) -> str:
+    base_url = os.getenv("BASE_URL", "https://hygienequestemdpoints.onrender.com")
+    return f"{base_url}/download-lessonplan/{pdf_filename}"
+
+
+def job_to_schema(job: LessonPlanJob) -> schemas.LessonPlanJob:
+    return schemas.LessonPlanJob(
+        job_id=job.id,
+        status=job.status,
+        score=job.score,
+        caption=job.caption,
+        download_url=download_url_for(job.pdf_filename) if job.status == "done" else None,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
+
+
+def save_upload(file: UploadFile, image_path: str) -> None:
+    with open(image_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pdf_cache_key(image_digest: str, teacher_name: str, school: str, caption: str) -> str:
+    """Identical inputs render identical PDFs, so the inputs name the file"""
+    return hashlib.sha256(
+        "\0".join((image_digest, teacher_name, school, caption)).encode()
+    ).hexdigest()[:32]
+
+
+async def render_lesson_plan_pdf(
+    teacher_name: str, school: str, caption: str, image_path: str, image_digest: str
+) -> str:
+    """Render the PDF in the CPU process pool, or reuse an identical one; returns its filename"""
+    pdf_filename = f"{pdf_cache_key(image_digest, teacher_name, school, caption)}.pdf"
+    pdf_path = os.path.join(GENERATED_DIR, pdf_filename)
+    if os.path.exists(pdf_path):
+        storage_manager.touch(pdf_path)
+        return pdf_filename
+
+    # Render beside the target and rename, so readers never see a partial file
+    tmp_path = f"{pdf_path}.{uuid.uuid4().hex}.tmp"
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        
-        # Header
-        pdf.cell(200, 10, txt="Enhanced Lesson Plan", ln=1, align='C')
-        pdf.cell(200, 10, txt=f"Teacher: {teacher_name}", ln=1)
-        pdf.cell(200, 10, txt=f"School: {school}", ln=1)
-        pdf.cell(200, 10, txt=f"Date: {datetime.now().strftime('%Y-%m-%d')}", ln=1)
-        pdf.cell(200, 10, txt="Generated by: Dettol Hygiene Quest Program", ln=1)
-        
-        # Add image if available
-        if image_path and os.path.exists(image_path):
-            try:
-                pdf.image(image_path, x=10, y=60, w=100)
-                pdf.set_y(160)  # Position after image
-            except Exception as img_error:
-                logger.warning(f"Could not add image to PDF: {img_error}")
-                pdf.cell(200, 10, txt="[Image could not be embedded]", ln=1)
-        
-        # Feedback section
-        pdf.ln(10)  # Add some space
-        pdf.multi_cell(0, 10, txt=f"Feedback:\n{caption}")
-        
-        pdf.output(pdf_path)
-    except Exception as e:
-        logger.error(f"Error generating PDF: {e}")
-        raise
+        await run_cpu_bound(generate_pdf, tmp_path, teacher_name, school, caption, image_path)
+        os.replace(tmp_path, pdf_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    storage_manager.track(pdf_path)
+    return pdf_filename
+
+
+def claimable_jobs(now: datetime):
+    """Queued jobs, plus running jobs whose process has presumably died"""
+    return or_(
+        LessonPlanJob.status == "queued",
+        and_(
+            LessonPlanJob.status == "running",
+            LessonPlanJob.started_at < now - timedelta(seconds=LESSONPLAN_JOB_TIMEOUT_SECONDS)
+        )
+    )
+
+
+async def run_job(job_id: str) -> None:
+    """Analyze the image and render the PDF for one queued submission"""
+    async with AsyncSessionLocal() as db:
+        # Claim atomically: with several API processes only one runs each job
+        now = datetime.utcnow()
+        claim = await db.execute(
+            update(LessonPlanJob)
+            .where(LessonPlanJob.id == job_id, claimable_jobs(now))
+            .values(status="running", started_at=now)
+        )
+        await db.commit()
+        job = await db.get(LessonPlanJob, job_id)
+        if job is None:
+            return
+        image_path = job.image_path
+        if claim.rowcount != 1:
+            storage_manager.unpin(image_path)
+            return
+
+        try:
+            # Hashed once, off the event loop; keys both the analysis and PDF caches
+            image_digest = await run_in_threadpool(file_sha256, job.image_path)
+
+            # Analyze image (with fallback if HF endpoint fails)
+            score, caption = await analyze_image_score(job.image_path, image_digest)
 
-@router.post("/submit-lessonplan/")
+            # Generate enhanced PDF
+            job.pdf_filename = await render_lesson_plan_pdf(
+                job.teacher_name, job.school, caption, job.image_path, image_digest
+            )
+
+            job.status = "done"
+            job.score = score
+            job.caption = caption
+        except Exception as e:
+            logger.error(f"Lesson plan job {job_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            # The upload may be evicted once the job no longer needs it
+            storage_manager.unpin(image_path)
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+
+
+async def job_worker(worker_id: int) -> None:
+    while True:
+        job_id = await job_queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            logger.error(f"Lesson plan worker {worker_id} could not run job {job_id}: {e}")
+        finally:
+            job_queue.task_done()
+
+
+@router.on_event("startup")
+async def start_job_workers():
+    # Jobs left queued, or running by a process that died, are picked up
+    # again; run_job's claim keeps other live processes from running them twice
+    async with AsyncSessionLocal() as db:
+        pending = (await db.execute(
+            select(LessonPlanJob.id, LessonPlanJob.image_path)
+            .where(claimable_jobs(datetime.utcnow()))
+            .order_by(LessonPlanJob.created_at)
+        )).all()
+    for job_id, image_path in pending:
+        storage_manager.pin(image_path)
+        job_queue.put_nowait(job_id)
+    if pending:
+        logger.info(f"Requeued {len(pending)} unfinished lesson plan jobs")
+
+    for worker_id in range(LESSONPLAN_WORKERS):
+        _workers.append(asyncio.create_task(job_worker(worker_id)))
+
+
+@router.on_event("shutdown")
+async def stop_job_workers():
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    await hf_client.aclose()
+
+
+@router.post(
+    "/submit-lessonplan/",
+    response_model=schemas.LessonPlanJob,
+    status_code=status.HTTP_202_ACCEPTED
+)
 async def submit_lesson_plan(
     file: UploadFile = File(...),
     teacher_name: str = Form(...),
-    school: str = Form(...)
+    school: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Handle lesson plan submission with robust error handling"""
+    """Queue a lesson plan for analysis; poll /lessonplan-jobs/{job_id} for the result"""
     try:
         # Create directories if they don't exist
-        os.makedirs("lessonplans/uploads", exist_ok=True)
-        os.makedirs("lessonplans/generated", exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        image_filename = f"{timestamp}_{file.filename}"
-        image_path = f"lessonplans/uploads/{image_filename}"
-        pdf_filename = f"{timestamp}_lessonplan.pdf"
-        pdf_path = f"lessonplans/generated/{pdf_filename}"
-        
-        # Save uploaded file
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Analyze image (with fallback if HF endpoint fails)
-        score, caption = analyze_image_score(image_path)
-        
-        # Generate enhanced PDF
-        generate_pdf(pdf_path, teacher_name, school, caption, image_path)
-        
-        # Construct download URL
-        base_url = os.getenv("BASE_URL", "https://hygienequestemdpoints.onrender.com")
-        download_url = f"{base_url}/download-lessonplan/{pdf_filename}"
-        
-        return {
-            "score": score,
-            "caption": caption,
-            "download_url": download_url,
-            "success": True
-        }
-        
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        os.makedirs(GENERATED_DIR, exist_ok=True)
+
+        job_id = str(uuid.uuid4())
+        image_path = os.path.join(UPLOAD_DIR, f"{job_id}_{os.path.basename(file.filename or 'upload')}")
+
+        # Save uploaded file; pinned until its job has run
+        storage_manager.pin(image_path)
+        try:
+            await run_in_threadpool(save_upload, file, image_path)
+        except Exception:
+            storage_manager.unpin(image_path)
+            raise
+        storage_manager.track(image_path)
+
+        job = LessonPlanJob(
+            id=job_id,
+            status="queued",
+            teacher_name=teacher_name,
+            school=school,
+            image_path=image_path,
+            created_at=datetime.utcnow()
+        )
+        db.add(job)
+        await db.commit()
+
+        job_queue.put_nowait(job_id)
+        return job_to_schema(job)
+
     except Exception as e:
         logger.error(f"Error in lesson plan submission: {e}")
         raise HTTPException(
@@ -151,17 +299,39 @@ async def submit_lesson_plan(
             detail=f"Failed to process lesson plan: {str(e)}"
         )
 
-@router.get("/download-lessonplan/{filename}")
-async def download_lesson_plan(filename: str):
-    """Serve generated PDF files"""
-    pdf_path = f"lessonplans/generated/{filename}"
-    if not os.path.exists(pdf_path):
+
+@router.get("/lessonplan-jobs/{job_id}", response_model=schemas.LessonPlanJob)
+async def get_lesson_plan_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Status of a submitted lesson plan; download_url is set once it is done"""
+    job = await db.get(LessonPlanJob, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Lesson plan job not found"
+        )
+    return job_to_schema(job)
+
+@router.api_route("/download-lessonplan/{filename}", methods=["GET", "HEAD"])
+async def download_lesson_plan(filename: str, request: Request):
+    """Serve generated PDF files.
+
+    Supports Range requests for resuming downloads and conditional GETs;
+    the files never change, so clients may cache them indefinitely.
+    """
+    # Only plain file names inside the generated directory
+    if filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(
+            status_code=404,
+            detail="Lesson plan not found"
+        )
+    pdf_path = os.path.join(GENERATED_DIR, filename)
+    response = await immutable_file_response(
+        request, pdf_path, media_type="application/pdf", filename=f"enhanced_{filename}"
+    )
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail="Lesson plan not found"
         )
-    return FileResponse(
-        pdf_path,
-        media_type="application/pdf",
-        filename=f"enhanced_{filename}"
-    )
\ No newline at end of file
+    storage_manager.touch(pdf_path)
+    return response
@@ -1,20 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, UploadFile, File, Form, Query, Body, Request, Response, BackgroundTasks
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field, field_validator
-from typing import List
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Any, List, Optional
 import re
+import base64
 from fastapi.middleware.cors import CORSMiddleware
-from lessonplan import router as lessonplan_router
+from fastapi.responses import JSONResponse
+from lessonplan import router as lessonplan_router, analysis_cache
 from dashboard_auth import router as dashboard_router
-from models import SessionLocal, engine, Base, User, Attendance, UserRole
+from analytics import router as analytics_router
+from reports import router as reports_router
+from models import User, Attendance, UserRole, get_db, get_async_db, pool_status
 import crud
 from schemas  import LessonPlanCreate
-from models import LessonPlan 
+from models import LessonPlan, UploadedImage, AsyncSessionLocal, dialect_insert
 from otp import send_otp, verify_otp
 from auth import get_current_user
 import os
 import schemas
-from spaces_storage import do_spaces
+from spaces_storage import do_spaces, MAX_UPLOAD_BYTES, MB
+from streaming import column_names, stream_query, STREAM_FORMATS, FORMAT_PATTERN
+from masking import attendance_columns, is_masked, user_columns
+from versions import bump_version_async, compute_etag, etag_matches
+from imaging import RENDITIONS, derivative_path, render_derivatives
+from cpu_pool import run_cpu_bound
+from hf_client import hf_client
+from storage_manager import storage_manager
+import cpu_pool
 import logging
 import uuid
 from datetime import datetime
@@ -24,8 +38,6 @@ import boto3
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
 # FastAPI app configuration
 app = FastAPI(
@@ -43,17 +55,6 @@ app.add_middleware(
 )
 
 
-
-# Dependency for database session
-def get_db():
-    """Get database session with proper cleanup."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
         # Load DigitalOcean Spaces credentials - Use the same names as in Render
 DO_SPACES_ACCESS_KEY = os.getenv("DO_SPACES_ACCESS_KEY")
 DO_SPACES_SECRET_KEY = os.getenv("DO_SPACES_SECRET_KEY")
@@ -97,26 +98,47 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))  # Send real reason back to frontend
 
 
+def etag_headers(etag: str) -> dict:
+    """Headers that let pollers revalidate with If-None-Match on every request."""
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def row_to_dict(row) -> dict:
+    """Plain dict of a column-projection row (no ORM objects involved)."""
+    return dict(row._mapping)
+
+
 @app.get("/registrations", response_model=List[schemas.User])
 def list_users(
+    request: Request,
+    response: Response,
+    format: str = Query("json", pattern=FORMAT_PATTERN),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all registered users with role-based masking."""
+    """Get all registered users with role-based masking.
+
+    format=ndjson|csv streams rows from a server-side cursor instead.
+    """
+    etag = compute_etag(db, request, (User,), current_user["role"])
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+
+    # Role-based masking for fieldworkers and managers, applied in the SELECT
+    columns = user_columns(is_masked(current_user["role"]))
+    if format in STREAM_FORMATS:
+        return stream_query(
+            lambda stream_db: stream_db.query(*columns).order_by(User.id),
+            row_to_dict,
+            format,
+            "registrations",
+            column_names(columns),
+            headers=etag_headers(etag)
+        )
+
     try:
-        users = crud.get_users(db)
-        
-        # Apply role-based masking for fieldworkers and managers
-        if current_user["role"] in [UserRole.FIELDWORKER, UserRole.MANAGER]:
-            for user in users:
-                # Mask school name with user ID
-                user.school = f"SCH-{user.id:04d}"
-                # Mask teacher name with masked identifier
-                user.name = f"Teacher-{user.id:04d}"
-                # Mask district name with masked identifier
-                user.district = f"District-{(user.id % 100):02d}"
-                
-        return users
+        return [row_to_dict(row) for row in db.query(*columns).order_by(User.id).all()]
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -141,42 +163,120 @@ def submit_attendance(data: schemas.AttendanceCreate, db: Session = Depends(get_
             detail="Failed to create attendance record"
         )
 
-@app.get("/attendances", response_model=List[dict])
+def attendance_page(rows, limit: int) -> dict:
+    """Build a keyset page; next_cursor is the last id when the page is full."""
+    items = [row_to_dict(row) for row in rows]
+    next_cursor = items[-1]["id"] if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# Upper bound on records accepted by a single bulk submission
+MAX_BULK_ATTENDANCE = int(os.getenv("MAX_BULK_ATTENDANCE", "1000"))
+
+
+@app.post("/attendance/bulk", status_code=status.HTTP_201_CREATED)
+def submit_attendance_bulk(records: List[Any] = Body(...), db: Session = Depends(get_db)):
+    """Submit a backlog of attendance records in one request.
+
+    Every record is validated; valid ones are inserted together and each
+    input index gets its own result entry.
+    """
+    if len(records) > MAX_BULK_ATTENDANCE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BULK_ATTENDANCE} records per request"
+        )
+
+    results = {}
+    valid = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[index] = {
+                "index": index,
+                "success": False,
+                "errors": [f"record must be an object, got {type(record).__name__}"]
+            }
+            continue
+        try:
+            valid.append((index, schemas.AttendanceCreate.model_validate(record)))
+        except ValidationError as e:
+            results[index] = {
+                "index": index,
+                "success": False,
+                "errors": [
+                    f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+                    for err in e.errors()
+                ]
+            }
+
+    try:
+        ids = crud.create_attendance_bulk(db, [attendance for _, attendance in valid])
+    except Exception as e:
+        print(f"❌ Bulk attendance error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create attendance records"
+        )
+
+    for (index, _), attendance_id in zip(valid, ids):
+        results[index] = {"index": index, "success": True, "id": attendance_id}
+
+    return {
+        "inserted": len(ids),
+        "failed": len(records) - len(ids),
+        "results": [results[index] for index in range(len(records))]
+    }
+
+@app.get("/attendances", response_model=dict)
 def list_attendance(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    district: Optional[str] = None,
+    subject: Optional[str] = None,
+    phone: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    format: str = Query("json", pattern=FORMAT_PATTERN),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all attendance records with role-based masking."""
+    """Get a page of attendance records with role-based masking.
+
+    Pass the returned next_cursor as after_id to fetch the following page.
+    from/to limit records to the created_at window [from, to); rows submitted
+    before created_at existed have none and are left out of windowed queries.
+    format=ndjson|csv streams every matching row instead of a single page.
+    """
+    etag = compute_etag(db, request, (Attendance, User), current_user["role"])
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+
+    # Role-based masking for fieldworkers and managers, applied in the SELECT
+    columns = attendance_columns(is_masked(current_user["role"]))
+    if format in STREAM_FORMATS:
+        return stream_query(
+            lambda stream_db: crud.attendance_with_users_query(
+                stream_db, columns, after_id=after_id,
+                district=district, subject=subject, phone=phone,
+                created_from=created_from, created_to=created_to
+            ),
+            row_to_dict,
+            format,
+            "attendances",
+            column_names(columns),
+            headers=etag_headers(etag)
+        )
+
     try:
-        # Join attendance with users table
-        results = db.query(Attendance, User).join(User, Attendance.phone == User.phone).all()
-        
-        attendance_list = []
-        for attendance, user in results:
-            attendance_data = {
-                "id": attendance.id,
-                "phone": attendance.phone,
-                "students_present": attendance.students_present,
-                "students_absent": attendance.students_absent,
-                "absence_reason": attendance.absence_reason,
-                "subject": attendance.subject,
-                "district": attendance.district,  # This comes from Attendance table
-                "teacher_name": user.name,        # This comes from User table
-                "school": user.school             # This comes from User table
-            }
-            
-            # Role-based masking for fieldworkers and managers
-            if current_user["role"] in [UserRole.FIELDWORKER, UserRole.MANAGER]:
-                # Mask district from Attendance table
-                attendance_data["district"] = f"DIST-{(attendance.id % 100):02d}"
-                # Mask teacher name from User table
-                attendance_data["teacher_name"] = f"Teacher-{user.id:04d}"
-                # Mask school name from User table
-                attendance_data["school"] = f"SCH-{user.id:04d}"
-                
-            attendance_list.append(attendance_data)
-        
-        return attendance_list
+        rows = crud.get_attendance_page(
+            db, columns, limit=limit, after_id=after_id,
+            district=district, subject=subject, phone=phone,
+            created_from=created_from, created_to=created_to
+        )
+        return attendance_page(rows, limit)
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(
@@ -222,6 +322,31 @@ def health_check():
     """Health check endpoint to verify API status."""
     return {"status": "healthy", "service": "School Attendance API"}
 
+@app.get("/metrics/db")
+def db_metrics():
+    """Connection pool usage: checked-out connections, overflow, waits and checkout latency."""
+    return pool_status()
+
+@app.get("/metrics/spaces")
+def spaces_metrics():
+    """Queue depth and activity of the thread pool running Spaces (boto3) calls."""
+    return do_spaces.metrics()
+
+@app.get("/metrics/hf")
+def hf_metrics():
+    """Circuit breaker state and request counters for the Hugging Face scoring endpoint."""
+    return hf_client.metrics()
+
+@app.get("/metrics/storage")
+def storage_metrics():
+    """Disk usage of the local lessonplans/ directories and retention evictions."""
+    return storage_manager.metrics()
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    """Size and hit/miss counters of the user lookup and image analysis caches."""
+    return {**crud.cache_stats(), "analysis_results": analysis_cache.stats()}
+
 # Optional: Add API documentation tags for better organization
 @app.get("/", include_in_schema=False)
 def root():
@@ -233,7 +358,7 @@ def root():
 def check_registration(phone: str, db: Session = Depends(get_db)):
     """Check if the phone number is already registered."""
     try:
-        user = crud.get_user_by_phone(db, phone)
+        user = crud.get_user_by_phone_cached(db, phone)
         if user:
             return {
                 "registered": True,
@@ -260,30 +385,16 @@ def get_specific_user(
 ):
     """Get a specific user by ID with role-based masking."""
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        # Role-based masking for fieldworkers, applied in the SELECT
+        columns = user_columns(current_user["role"] == UserRole.FIELDWORKER)
+        user = db.query(*columns).filter(User.id == user_id).first()
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        # Prepare response data
-        response_data = {
-            "id": user.id,
-            "name": user.name,
-            "school": user.school,
-            "district": user.district,
-            "language": user.language,
-            "phone": user.phone
-        }
-        
-        # Role-based masking for fieldworkers
-        if current_user["role"] == UserRole.FIELDWORKER:
-            response_data["name"] = f"Teacher-{user.id:04d}"
-            response_data["school"] = f"SCH-{user.id:04d}"
-            response_data["district"] = f"District-{(user.id % 100):02d}"
-        
-        return response_data
+        return row_to_dict(user)
     except HTTPException:
         raise
     except Exception as e:
@@ -398,56 +509,167 @@ def get_user_export_requests(
 
 #LessonUploadFunctionalityToGoogleCloudSQLAnd
 
+# Room for the form fields and multipart framing around the image itself
+UPLOAD_FORM_OVERHEAD = MB
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse oversized lesson plan uploads from Content-Length, before the body is read."""
+    if request.url.path == "/lessonplan/upload":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": f"File exceeds {MAX_UPLOAD_BYTES // MB} MB limit"}
+            )
+    return await call_next(request)
+
+
+def upload_size(file: UploadFile) -> int:
+    """Size of a spooled upload without reading it into memory."""
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+async def save_lesson_plan(db: AsyncSession, **fields) -> LessonPlan:
+    """Insert a lesson plan row for an image already stored in Spaces."""
+    lesson_plan = LessonPlan(created_at=datetime.utcnow(), **fields)
+    db.add(lesson_plan)
+    await bump_version_async(db, "lesson_plans")
+    await db.commit()
+    await db.refresh(lesson_plan)
+    return lesson_plan
+
+
+async def record_uploaded_image(db: AsyncSession, digest: str, upload_result: dict, size: int) -> None:
+    """Add a hash -> object entry; committed together with the lesson plan row."""
+    insert = dialect_insert(db.bind)
+    await db.execute(
+        insert(UploadedImage).values(
+            sha256=digest,
+            spaces_file_path=upload_result["file_path"],
+            public_url=upload_result["public_url"],
+            size=size,
+            created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["sha256"])
+    )
+
+
+async def generate_lesson_plan_renditions(file_path: str) -> None:
+    """Background task: build thumbnail/medium WebP renditions for an image in Spaces.
+
+    Decoding and resizing run in the CPU process pool; the URLs are written to
+    every lesson plan that points at the image.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            done = (await db.execute(
+                select(LessonPlan.thumbnail_url, LessonPlan.medium_url).where(
+                    LessonPlan.spaces_file_path == file_path,
+                    LessonPlan.thumbnail_url.isnot(None)
+                ).limit(1)
+            )).first()
+
+        if done:
+            urls = {"thumbnail_url": done.thumbnail_url, "medium_url": done.medium_url}
+        else:
+            data = await do_spaces.download_file_async(file_path)
+            if data is None:
+                return
+            renditions = await run_cpu_bound(render_derivatives, data)
+            urls = {}
+            for name, body in renditions.items():
+                result = await do_spaces.put_bytes_async(derivative_path(file_path, name), body, "image/webp")
+                if not result["success"]:
+                    return
+                urls[name] = result["public_url"]
+            urls = {"thumbnail_url": urls["thumb"], "medium_url": urls["medium"]}
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(LessonPlan)
+                .where(LessonPlan.spaces_file_path == file_path, LessonPlan.thumbnail_url.is_(None))
+                .values(**urls)
+            )
+            await bump_version_async(db, "lesson_plans")
+            await db.commit()
+        logger.info(f"🖼️ Renditions ready for {file_path}")
+    except Exception:
+        logger.exception(f"❌ Failed to build renditions for {file_path}")
+
+
 @app.post("/lessonplan/upload")
 async def upload_lesson_plan(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     phone: str = Form(...),
     score: int = Form(...),
     subject: str = Form(...),
     feedback: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         logger.info(f"📥 Upload attempt: phone={phone}, score={score}, subject={subject}")
 
-        # Read file content
-        file_content = await file.read()
-        
-        # Use your DigitalOcean Spaces utility
-        upload_result = do_spaces.upload_file(
-            file_content, 
-            file.filename,
-            content_type=file.content_type
-        )
-        
-        if not upload_result["success"]:
+        if upload_size(file) > MAX_UPLOAD_BYTES:
             raise HTTPException(
-                status_code=500, 
-                detail=f"Upload failed: {upload_result.get('error', 'Unknown error')}"
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File exceeds {MAX_UPLOAD_BYTES // MB} MB limit"
             )
 
-        logger.info(f"✅ File uploaded: {upload_result['public_url']}")
+        # Re-submitted photos reuse the object already stored for the same content
+        digest = await do_spaces.sha256_fileobj_async(file.file)
+        existing_image = (await db.execute(
+            select(UploadedImage).where(UploadedImage.sha256 == digest)
+        )).scalars().first()
+
+        if existing_image:
+            upload_result = {
+                "success": True,
+                "file_path": existing_image.spaces_file_path,
+                "public_url": existing_image.public_url
+            }
+            logger.info(f"♻️ Reusing stored image: {upload_result['public_url']}")
+        else:
+            # Stream the spooled upload to Spaces instead of reading it into memory
+            upload_result = await do_spaces.upload_fileobj_async(
+                file.file,
+                file.filename,
+                content_type=file.content_type
+            )
+            
+            if not upload_result["success"]:
+                raise HTTPException(
+                    status_code=500, 
+                    detail=f"Upload failed: {upload_result.get('error', 'Unknown error')}"
+                )
+
+            logger.info(f"✅ File uploaded: {upload_result['public_url']}")
+            await record_uploaded_image(db, digest, upload_result, upload_size(file))
 
         # Save to DB
-        lesson_plan = LessonPlan(
+        lesson_plan = await save_lesson_plan(
+            db,
             phone=phone,
             score=score,
             subject=subject,
             feedback=feedback,
             spaces_file_path=upload_result["file_path"],
             original_filename=file.filename,
-            public_url=upload_result["public_url"],
-            created_at=datetime.utcnow()
+            public_url=upload_result["public_url"]
         )
-        
-        db.add(lesson_plan)
-        db.commit()
-        db.refresh(lesson_plan)
+        background_tasks.add_task(generate_lesson_plan_renditions, lesson_plan.spaces_file_path)
 
         return {
             "success": True, 
             "id": lesson_plan.id,
             "image_url": upload_result["public_url"],
+            "deduplicated": existing_image is not None,
             "message": "Lesson plan uploaded successfully"
         }
         
@@ -456,74 +678,83 @@ async def upload_lesson_plan(
     except Exception as e:
         logger.exception("❌ Upload failed")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
-async def upload_lesson_plan(
-    file: UploadFile = File(...),
-    phone: str = Form(...),
-    score: int = Form(...),
-    subject: str = Form(...),
-    feedback: str = Form(...),
-    db: Session = Depends(get_db)
+
+@app.post("/lessonplan/upload-url")
+def create_lesson_plan_upload_url(request_data: schemas.LessonPlanUploadURLRequest):
+    """Step 1 of a direct upload: presigned POST form for sending the image straight to Spaces."""
+    # Signing is local computation; no request is made to Spaces here
+    result = do_spaces.generate_presigned_upload(request_data.filename, request_data.content_type)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.post("/lessonplan/complete")
+async def complete_lesson_plan_upload(
+    data: schemas.LessonPlanUploadComplete,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Step 2 of a direct upload: check the object landed in Spaces, then record the lesson plan."""
     try:
-        logger.info(f"📥 Upload attempt: phone={phone}, score={score}, subject={subject}")
+        # Only keys this API issued an upload form for; never renditions or other objects
+        if not do_spaces.verify_upload_token(data.file_path, data.upload_token):
+            raise HTTPException(status_code=403, detail="Invalid or expired upload token")
 
-        # Read file content
-        file_content = await file.read()
-        
-        # Use your DigitalOcean Spaces utility
-        upload_result = do_spaces.upload_file(
-            file_content, 
-            file.filename,
-            content_type=file.content_type
+        existing = await db.execute(
+            select(LessonPlan.id).where(LessonPlan.spaces_file_path == data.file_path)
         )
-        
-        if not upload_result["success"]:
+        if existing.first():
+            raise HTTPException(status_code=409, detail="Upload already completed")
+
+        head = await do_spaces.head_file_async(data.file_path)
+        if not head["success"]:
+            raise HTTPException(status_code=400, detail="Uploaded file not found in storage")
+        if head["size"] > MAX_UPLOAD_BYTES:
+            await do_spaces.delete_file_async(data.file_path)
             raise HTTPException(
-                status_code=500, 
-                detail=f"Upload failed: {upload_result.get('error', 'Unknown error')}"
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File exceeds {MAX_UPLOAD_BYTES // MB} MB limit"
             )
+        if not (head["content_type"] or "").startswith("image/"):
+            await do_spaces.delete_file_async(data.file_path)
+            raise HTTPException(status_code=400, detail="Uploaded file is not an image")
 
-        logger.info(f"✅ File uploaded: {upload_result['public_url']}")
-
-        # Save to DB
-        lesson_plan = LessonPlan(
-            phone=phone,
-            score=score,
-            subject=subject,
-            feedback=feedback,
-            spaces_file_path=upload_result["file_path"],
-            original_filename=file.filename,
-            public_url=upload_result["public_url"],
-            created_at=datetime.utcnow()
+        lesson_plan = await save_lesson_plan(
+            db,
+            phone=data.phone,
+            score=data.score,
+            subject=data.subject,
+            feedback=data.feedback,
+            spaces_file_path=data.file_path,
+            original_filename=data.original_filename,
+            public_url=do_spaces.public_url_for(data.file_path)
         )
-        
-        db.add(lesson_plan)
-        db.commit()
-        db.refresh(lesson_plan)
+        background_tasks.add_task(generate_lesson_plan_renditions, lesson_plan.spaces_file_path)
 
         return {
-            "success": True, 
+            "success": True,
             "id": lesson_plan.id,
-            "image_url": upload_result["public_url"],
+            "image_url": lesson_plan.public_url,
             "message": "Lesson plan uploaded successfully"
         }
-        
+
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception("❌ Upload failed")
+        logger.exception("❌ Upload completion failed")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
-    
+
 
 @app.get("/lessonplan/image/{lesson_plan_id}")
 async def get_lesson_plan_image(
     lesson_plan_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     # Remove: current_user: dict = Depends(get_current_user)
 ):
     """Get the lesson plan image URL"""
     try:
-        lesson_plan = db.query(LessonPlan).filter(LessonPlan.id == lesson_plan_id).first()
+        lesson_plan = await db.get(LessonPlan, lesson_plan_id)
         
         if not lesson_plan:
             raise HTTPException(status_code=404, detail="Lesson plan not found")
@@ -542,7 +773,7 @@ async def get_lesson_plan_image(
 @app.delete("/lessonplan/{lesson_plan_id}")
 async def delete_lesson_plan(
     lesson_plan_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a lesson plan and its associated file"""
@@ -550,17 +781,30 @@ async def delete_lesson_plan(
         if current_user["role"] != UserRole.SUPERADMIN:
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        lesson_plan = db.query(LessonPlan).filter(LessonPlan.id == lesson_plan_id).first()
+        lesson_plan = await db.get(LessonPlan, lesson_plan_id)
         
         if not lesson_plan:
             raise HTTPException(status_code=404, detail="Lesson plan not found")
         
-        # Delete file from Digital Ocean Spaces
-        do_spaces.delete_file(lesson_plan.spaces_file_path)
+        # Delete file from Digital Ocean Spaces unless another plan shares the image
+        shared = (await db.execute(
+            select(LessonPlan.id).where(
+                LessonPlan.spaces_file_path == lesson_plan.spaces_file_path,
+                LessonPlan.id != lesson_plan.id
+            ).limit(1)
+        )).first()
+        if not shared:
+            await do_spaces.delete_file_async(lesson_plan.spaces_file_path)
+            for name in RENDITIONS:
+                await do_spaces.delete_file_async(derivative_path(lesson_plan.spaces_file_path, name))
+            await db.execute(
+                delete(UploadedImage).where(UploadedImage.spaces_file_path == lesson_plan.spaces_file_path)
+            )
         
         # Delete database record
-        db.delete(lesson_plan)
-        db.commit()
+        await db.delete(lesson_plan)
+        await bump_version_async(db, "lesson_plans")
+        await db.commit()
         
         return {"success": True, "message": "Lesson plan deleted successfully"}
         
@@ -570,12 +814,54 @@ async def delete_lesson_plan(
             detail=f"Failed to delete lesson plan: {str(e)}"
         )
 
-@app.get("/lessonplans/my-school", response_model=List[schemas.LessonPlan])
+def lesson_plan_to_dict(plan: LessonPlan, user: Optional[User]) -> dict:
+    """Serialize a lesson plan enriched with its teacher's details."""
+    return {
+        "id": plan.id,
+        "phone": plan.phone,
+        "score": plan.score,
+        "subject": plan.subject,
+        "feedback": plan.feedback,
+        "spaces_file_path": plan.spaces_file_path,
+        "original_filename": plan.original_filename,
+        "public_url": plan.public_url,
+        "thumbnail_url": plan.thumbnail_url,
+        "medium_url": plan.medium_url,
+        "created_at": plan.created_at,
+        "teacher_name": user.name if user else "Unknown",
+        "school": user.school if user else "Unknown",
+        "district": user.district if user else "Unknown"
+    }
+
+
+def encode_lesson_plan_cursor(plan: LessonPlan) -> str:
+    """Opaque cursor holding the (created_at, id) keyset position of a plan."""
+    raw = f"{plan.created_at.isoformat()}|{plan.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_lesson_plan_cursor(cursor: str) -> tuple:
+    try:
+        created_at, plan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(plan_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/lessonplans/my-school", response_model=dict)
 def get_lesson_plans_my_school(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    subject: Optional[str] = None,
+    min_score: Optional[int] = Query(None, ge=0, le=100),
+    max_score: Optional[int] = Query(None, ge=0, le=100),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get lesson plans for the current user's school"""
+    """Get a page of lesson plans for the current user's school, newest first.
+
+    Pass the returned next_cursor as cursor to fetch the following page.
+    """
     try:
         # Get the current user's phone from the token
         user_phone = current_user.get("phone")
@@ -583,45 +869,27 @@ def get_lesson_plans_my_school(
             raise HTTPException(status_code=400, detail="User phone not found in token")
         
         # Find the user in the database to get their school
-        user = db.query(User).filter(User.phone == user_phone).first()
+        user = crud.get_user_by_phone_cached(db, user_phone)
         if not user:
             raise HTTPException(status_code=404, detail="User not found in database")
         
         school_name = user.school
         if not school_name:
-            return []
+            return {"items": [], "next_cursor": None}
         
-        # Get all users from this school
-        school_users = db.query(User).filter(User.school == school_name).all()
-        user_phones = [user.phone for user in school_users]
-        
-        if not user_phones:
-            return []
-        
-        # Get lesson plans for these users
-        lesson_plans = db.query(LessonPlan).filter(LessonPlan.phone.in_(user_phones)).all()
-        
-        # Enhance with user information
-        enhanced_plans = []
-        for plan in lesson_plans:
-            user = next((u for u in school_users if u.phone == plan.phone), None)
-            enhanced_plans.append({
-                "id": plan.id,
-                "phone": plan.phone,
-                "score": plan.score,
-                "subject": plan.subject,
-                "feedback": plan.feedback,
-                "spaces_file_path": plan.spaces_file_path,
-                "original_filename": plan.original_filename,
-                "public_url": plan.public_url,
-                "created_at": plan.created_at,
-                "teacher_name": user.name if user else "Unknown",
-                "school": user.school if user else "Unknown",
-                "district": user.district if user else "Unknown"
-            })
+        # One indexed join of lesson plans to their teachers at this school
+        rows = crud.get_school_lesson_plans_page(
+            db, school_name, limit=limit,
+            before=decode_lesson_plan_cursor(cursor) if cursor else None,
+            subject=subject, min_score=min_score, max_score=max_score
+        )
         
-        return enhanced_plans
+        items = [lesson_plan_to_dict(plan, teacher) for plan, teacher in rows]
+        next_cursor = encode_lesson_plan_cursor(rows[-1][0]) if len(rows) == limit else None
+        return {"items": items, "next_cursor": next_cursor}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -631,8 +899,28 @@ def get_lesson_plans_my_school(
 # Add these endpoints to your main.py (without authentication) (Desperate call to fetch data)
 
 @app.get("/public/registrations", response_model=List[schemas.User])
-def list_users_public(db: Session = Depends(get_db)):
+def list_users_public(
+    request: Request,
+    response: Response,
+    format: str = Query("json", pattern=FORMAT_PATTERN),
+    db: Session = Depends(get_db)
+):
     """Get all registered users without authentication (for dashboard)."""
+    etag = compute_etag(db, request, (User,))
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+
+    if format in STREAM_FORMATS:
+        return stream_query(
+            lambda stream_db: stream_db.query(*user_columns()).order_by(User.id),
+            row_to_dict,
+            format,
+            "registrations",
+            column_names(user_columns()),
+            headers=etag_headers(etag)
+        )
+
     try:
         users = crud.get_users(db)
         return users
@@ -642,29 +930,48 @@ def list_users_public(db: Session = Depends(get_db)):
             detail="Failed to retrieve users"
         )
 
-@app.get("/public/attendances", response_model=List[dict])
-def list_attendance_public(db: Session = Depends(get_db)):
-    """Get all attendance records without authentication (for dashboard)."""
+@app.get("/public/attendances", response_model=dict)
+def list_attendance_public(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    district: Optional[str] = None,
+    subject: Optional[str] = None,
+    phone: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    format: str = Query("json", pattern=FORMAT_PATTERN),
+    db: Session = Depends(get_db)
+):
+    """Get a page of attendance records without authentication (for dashboard)."""
+    etag = compute_etag(db, request, (Attendance, User))
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+
+    columns = attendance_columns()
+    if format in STREAM_FORMATS:
+        return stream_query(
+            lambda stream_db: crud.attendance_with_users_query(
+                stream_db, columns, after_id=after_id,
+                district=district, subject=subject, phone=phone,
+                created_from=created_from, created_to=created_to
+            ),
+            row_to_dict,
+            format,
+            "attendances",
+            column_names(columns),
+            headers=etag_headers(etag)
+        )
+
     try:
-        # Join attendance with users table
-        results = db.query(Attendance, User).join(User, Attendance.phone == User.phone).all()
-        
-        attendance_list = []
-        for attendance, user in results:
-            attendance_data = {
-                "id": attendance.id,
-                "phone": attendance.phone,
-                "students_present": attendance.students_present,
-                "students_absent": attendance.students_absent,
-                "absence_reason": attendance.absence_reason,
-                "subject": attendance.subject,
-                "district": attendance.district,
-                "teacher_name": user.name,
-                "school": user.school
-            }
-            attendance_list.append(attendance_data)
-        
-        return attendance_list
+        rows = crud.get_attendance_page(
+            db, columns, limit=limit, after_id=after_id,
+            district=district, subject=subject, phone=phone,
+            created_from=created_from, created_to=created_to
+        )
+        return attendance_page(rows, limit)
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(
@@ -673,8 +980,30 @@ def list_attendance_public(db: Session = Depends(get_db)):
         )
 
 @app.get("/public/lessonplans", response_model=List[schemas.LessonPlan])
-def get_all_lesson_plans_public(db: Session = Depends(get_db)):
+def get_all_lesson_plans_public(
+    request: Request,
+    response: Response,
+    format: str = Query("json", pattern=FORMAT_PATTERN),
+    db: Session = Depends(get_db)
+):
     """Get all lesson plans without authentication (for dashboard)."""
+    etag = compute_etag(db, request, (LessonPlan, User))
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+
+    if format in STREAM_FORMATS:
+        return stream_query(
+            lambda stream_db: stream_db.query(LessonPlan, User)
+            .outerjoin(User, LessonPlan.phone == User.phone)
+            .order_by(LessonPlan.id),
+            lambda row: lesson_plan_to_dict(row[0], row[1]),
+            format,
+            "lessonplans",
+            list(schemas.LessonPlan.model_fields),
+            headers=etag_headers(etag)
+        )
+
     try:
         lesson_plans = db.query(LessonPlan).all()
         users = db.query(User).all()
@@ -682,25 +1011,7 @@ def get_all_lesson_plans_public(db: Session = Depends(get_db)):
         # Create a mapping of phone to user
         user_map = {user.phone: user for user in users}
         
-        enhanced_plans = []
-        for plan in lesson_plans:
-            user = user_map.get(plan.phone)
-            enhanced_plans.append({
-                "id": plan.id,
-                "phone": plan.phone,
-                "score": plan.score,
-                "subject": plan.subject,
-                "feedback": plan.feedback,
-                "spaces_file_path": plan.spaces_file_path,
-                "original_filename": plan.original_filename,
-                "public_url": plan.public_url,
-                "created_at": plan.created_at,
-                "teacher_name": user.name if user else "Unknown",
-                "school": user.school if user else "Unknown",
-                "district": user.district if user else "Unknown"
-            })
-        
-        return enhanced_plans
+        return [lesson_plan_to_dict(plan, user_map.get(plan.phone)) for plan in lesson_plans]
         
     except Exception as e:
         raise HTTPException(
@@ -709,8 +1020,21 @@ def get_all_lesson_plans_public(db: Session = Depends(get_db)):
         )
 
 
+@app.on_event("startup")
+async def start_storage_sweeper():
+    storage_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_worker_pools():
+    await storage_manager.stop()
+    do_spaces.shutdown()
+    cpu_pool.shutdown()
+
+
 # Include routers
 app.include_router(export_router)
 app.include_router(lessonplan_router)
 app.include_router(dashboard_router)
+app.include_router(analytics_router)
+app.include_router(reports_router)
 
@@ -0,0 +1,88 @@
+# masking.py
+"""Role-based masking done inside the SELECT.
+
+Masked columns are computed by the database, so masked reads never hydrate
+(or risk flushing) ORM objects and can be streamed straight from the cursor.
+"""
+from sqlalchemy import String, literal, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from models import Attendance, User, UserRole
+
+# Roles that only ever see pseudonymous teacher/school/district values
+MASKED_ROLES = (UserRole.FIELDWORKER, UserRole.MANAGER)
+
+
+def is_masked(role) -> bool:
+    return role in MASKED_ROLES
+
+
+class zero_pad(FunctionElement):
+    """Integer rendered as zero-padded text, like f"{value:0{width}d}" in Python"""
+    type = String()
+    name = "zero_pad"
+    inherit_cache = True
+
+    def __init__(self, value, width: int):
+        super().__init__(value, literal_column(str(int(width))))
+
+
+@compiles(zero_pad, "sqlite")
+def _zero_pad_sqlite(element, compiler, **kw):
+    value, width = element.clauses
+    return f"printf('%0{compiler.process(width, **kw)}d', {compiler.process(value, **kw)})"
+
+
+@compiles(zero_pad)
+def _zero_pad_default(element, compiler, **kw):
+    value, width = element.clauses
+    value_sql = compiler.process(value, **kw)
+    width_sql = compiler.process(width, **kw)
+    # lpad truncates longer values, so only pad ids that fit in the width
+    return (
+        f"CASE WHEN {value_sql} >= 0 AND {value_sql} < {10 ** int(width_sql)} "
+        f"THEN lpad(CAST({value_sql} AS TEXT), {width_sql}, '0') "
+        f"ELSE CAST({value_sql} AS TEXT) END"
+    )
+
+
+def _pseudonym(prefix: str, value, width: int):
+    return literal(prefix, String) + zero_pad(value, width)
+
+
+def user_columns(mask: bool = False) -> list:
+    """Columns of a registration row, masked for restricted roles"""
+    if not mask:
+        return [User.id, User.phone, User.name, User.school, User.district, User.language]
+    return [
+        User.id,
+        User.phone,
+        _pseudonym("Teacher-", User.id, 4).label("name"),
+        _pseudonym("SCH-", User.id, 4).label("school"),
+        _pseudonym("District-", User.id % 100, 2).label("district"),
+        User.language,
+    ]
+
+
+def attendance_columns(mask: bool = False) -> list:
+    """Columns of an attendance row joined to its teacher, masked for restricted roles"""
+    columns = [
+        Attendance.id,
+        Attendance.phone,
+        Attendance.students_present,
+        Attendance.students_absent,
+        Attendance.absence_reason,
+        Attendance.subject,
+        Attendance.created_at,
+    ]
+    if not mask:
+        return columns + [
+            Attendance.district,
+            User.name.label("teacher_name"),
+            User.school.label("school"),
+        ]
+    return columns + [
+        _pseudonym("DIST-", Attendance.id % 100, 2).label("district"),
+        _pseudonym("Teacher-", User.id, 4).label("teacher_name"),
+        _pseudonym("SCH-", User.id, 4).label("school"),
+    ]
@@ -0,0 +1,343 @@
+# migrations.py
+"""Versioned schema migrations.
+
+Run at deploy time, before starting the API:
+
+    python migrations.py upgrade   # apply pending migrations
+    python migrations.py status    # list applied / pending migrations
+    python migrations.py explain   # check each hot query is served by an index
+"""
+import sys
+from datetime import datetime
+from sqlalchemy import (
+    Boolean, Column, DateTime, Enum, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    UniqueConstraint, inspect, select, text
+)
+from sqlalchemy.orm import Session
+from models import engine, Attendance, ExportRequest, LessonPlan, LessonPlanJob, User
+from rollup import rebuild_attendance_rollup
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200)),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    """Register a migration step; steps run in version order, once each"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return fn
+    return register
+
+
+def create_indexes(conn, *indexes) -> None:
+    for index in indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+def index_named(model, name: str):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+# Table definitions are frozen as of the step that creates them; later columns
+# and indexes come from later steps, so every step really runs on a fresh database
+baseline_metadata = MetaData()
+
+Table(
+    "users",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("phone", String(15), unique=True, index=True),
+    Column("name", String(100)),
+    Column("school", String(100)),
+    Column("district", String(100)),
+    Column("language", String(50)),
+)
+
+Table(
+    "attendance",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("phone", String(15), index=True),
+    Column("students_present", Integer),
+    Column("students_absent", Integer),
+    Column("absence_reason", Text),
+    Column("subject", Text),
+    Column("district", String(100)),
+)
+
+Table(
+    "attendance_rollup",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("school", String(100), nullable=False, default=""),
+    Column("district", String(100), nullable=False, default=""),
+    Column("subject", Text, nullable=False, default=""),
+    Column("records", Integer, nullable=False, default=0),
+    Column("students_present", Integer, nullable=False, default=0),
+    Column("students_absent", Integer, nullable=False, default=0),
+    Column("min_user_id", Integer, nullable=True),
+    Column("min_attendance_id", Integer, nullable=True),
+    UniqueConstraint("school", "district", "subject", name="uq_attendance_rollup_group"),
+)
+
+Table(
+    "lesson_plans",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("phone", String(15), index=True),
+    Column("score", Integer),
+    Column("subject", String(100)),
+    Column("feedback", Text),
+    Column("spaces_file_path", String(255)),
+    Column("original_filename", String(255)),
+    Column("public_url", String(500)),
+    Column("created_at", DateTime),
+)
+
+Table(
+    "table_versions",
+    baseline_metadata,
+    Column("table_name", String(50), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+Table(
+    "dashboard_users",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("phone", String(15), unique=True, index=True),
+    Column("name", String(100)),
+    Column("role", Enum("SUPERADMIN", "MANAGER", "FIELDWORKER", name="userrole")),
+    Column("is_verified", Boolean, default=False),
+    Column("otp", String(6), nullable=True),
+    Column("otp_expiry", Integer, nullable=True),
+)
+
+Table(
+    "export_requests",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("requester_id", Integer, ForeignKey("dashboard_users.id")),
+    Column("requester_name", String(100)),
+    Column("requester_phone", String(15)),
+    Column("data_type", String(100)),
+    Column("record_count", Integer),
+    Column("reason", Text),
+    Column("status", String(20), default="pending"),
+    Column("created_at", DateTime),
+    Column("approved_by", String(100), nullable=True),
+    Column("approved_at", DateTime, nullable=True),
+)
+
+
+@migration(1, "baseline schema")
+def baseline(conn):
+    # Databases created before migrations existed already have these tables
+    baseline_metadata.create_all(bind=conn)
+
+
+@migration(2, "composite indexes for hot query shapes")
+def hot_query_indexes(conn):
+    create_indexes(
+        conn,
+        index_named(User, "ix_users_school"),
+        index_named(Attendance, "ix_attendance_district_subject"),
+        index_named(Attendance, "ix_attendance_subject"),
+        index_named(LessonPlan, "ix_lesson_plans_phone_created_at"),
+        index_named(ExportRequest, "ix_export_requests_requester_status_created"),
+        index_named(ExportRequest, "ix_export_requests_created_at"),
+    )
+
+
+@migration(3, "attendance.created_at with time-window indexes")
+def attendance_created_at(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("attendance")}
+    if "created_at" not in columns:
+        conn.execute(text("ALTER TABLE attendance ADD COLUMN created_at TIMESTAMP"))
+    # Older rows carry no submission time and stay NULL, so from/to windows
+    # never count them (all-time totals still do)
+    create_indexes(
+        conn,
+        index_named(Attendance, "ix_attendance_created_at"),
+        index_named(Attendance, "ix_attendance_district_created_at"),
+    )
+
+
+@migration(4, "uploaded_images content-hash index")
+def uploaded_images(conn):
+    Table(
+        "uploaded_images",
+        MetaData(),
+        Column("id", Integer, primary_key=True, index=True),
+        Column("sha256", String(64), unique=True, index=True, nullable=False),
+        Column("spaces_file_path", String(255), nullable=False),
+        Column("public_url", String(500)),
+        Column("size", Integer),
+        Column("created_at", DateTime),
+    ).create(bind=conn, checkfirst=True)
+
+
+@migration(5, "lesson_plans thumbnail and medium rendition URLs")
+def lesson_plan_renditions(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("lesson_plans")}
+    for name in ("thumbnail_url", "medium_url"):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE lesson_plans ADD COLUMN {name} VARCHAR(500)"))
+
+
+@migration(6, "lesson_plan_jobs queue table")
+def lesson_plan_jobs(conn):
+    Table(
+        "lesson_plan_jobs",
+        MetaData(),
+        Column("id", String(36), primary_key=True),
+        Column("status", String(20)),
+        Column("teacher_name", String(100)),
+        Column("school", String(100)),
+        Column("image_path", String(255)),
+        Column("pdf_filename", String(255), nullable=True),
+        Column("score", Integer, nullable=True),
+        Column("caption", Text, nullable=True),
+        Column("error", Text, nullable=True),
+        Column("created_at", DateTime),
+        Column("started_at", DateTime, nullable=True),
+        Column("finished_at", DateTime, nullable=True),
+        Index("ix_lesson_plan_jobs_status_created_at", "status", "created_at"),
+    ).create(bind=conn, checkfirst=True)
+
+
+@migration(7, "attendance_rollup seeded from existing attendance")
+def attendance_rollup_seed(conn):
+    # The table starts empty on databases that already hold attendance;
+    # recompute it so the summary endpoint reports historical totals
+    with Session(bind=conn) as db:
+        groups = rebuild_attendance_rollup(db, commit=False)
+        db.flush()
+    print(f"Seeded attendance rollup: {groups} groups")
+
+
+def applied_versions() -> set:
+    migration_metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade() -> None:
+    done = applied_versions()
+    for version, description, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
+        print(f"Applied migration {version}: {description}")
+
+
+def status() -> None:
+    done = applied_versions()
+    for version, description, _ in MIGRATIONS:
+        print(f"{version:>4}  {'applied' if version in done else 'pending'}  {description}")
+
+
+# Hot query shapes and the index each one is expected to use
+HOT_QUERIES = [
+    (
+        "users by school",
+        select(User.id).where(User.school == "S"),
+        "ix_users_school",
+    ),
+    (
+        "attendance by district and subject",
+        select(Attendance.id).where(Attendance.district == "D", Attendance.subject == "S").order_by(Attendance.id),
+        "ix_attendance_district_subject",
+    ),
+    (
+        "attendance by subject",
+        select(Attendance.id).where(Attendance.subject == "S").order_by(Attendance.id),
+        "ix_attendance_subject",
+    ),
+    (
+        "attendance in a time window",
+        select(Attendance.id).where(Attendance.created_at >= datetime(2024, 1, 1)),
+        "ix_attendance_created_at",
+    ),
+    (
+        "attendance for a district in a time window",
+        select(Attendance.id).where(
+            Attendance.district == "D",
+            Attendance.created_at >= datetime(2024, 1, 1),
+            Attendance.created_at < datetime(2024, 4, 1),
+        ),
+        "ix_attendance_district_created_at",
+    ),
+    (
+        "lesson plans for a school, newest first",
+        select(LessonPlan.id)
+        .join(User, LessonPlan.phone == User.phone)
+        .where(User.school == "S")
+        .order_by(LessonPlan.created_at.desc()),
+        "ix_lesson_plans_phone_created_at",
+    ),
+    (
+        "unfinished lesson plan jobs, oldest first",
+        select(LessonPlanJob.id)
+        .where(LessonPlanJob.status == "queued")
+        .order_by(LessonPlanJob.created_at),
+        "ix_lesson_plan_jobs_status_created_at",
+    ),
+    (
+        "export requests by requester and status",
+        select(ExportRequest.id)
+        .where(ExportRequest.requester_id == 1, ExportRequest.status == "approved")
+        .order_by(ExportRequest.created_at.desc()),
+        "ix_export_requests_requester_status_created",
+    ),
+    (
+        "latest export requests",
+        select(ExportRequest.id).order_by(ExportRequest.created_at.desc()).limit(100),
+        "ix_export_requests_created_at",
+    ),
+]
+
+
+def explain() -> bool:
+    """EXPLAIN every hot query and report whether its expected index is used"""
+    ok = True
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            # Tiny tables make sequential scans look cheaper; test index usability instead
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            prefix = "EXPLAIN "
+        else:
+            prefix = "EXPLAIN QUERY PLAN "
+        for name, stmt, index_name in HOT_QUERIES:
+            sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = "\n".join(str(row[-1]) for row in conn.exec_driver_sql(prefix + sql))
+            used = index_name in plan
+            ok = ok and used
+            print(f"{'ok  ' if used else 'FAIL'}  {name}: expected {index_name}")
+            if not used:
+                print("      " + plan.replace("\n", "\n      "))
+    return ok
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "upgrade":
+        upgrade()
+    elif command == "status":
+        status()
+    elif command == "explain":
+        sys.exit(0 if explain() else 1)
+    else:
+        print(__doc__.strip())
+        sys.exit(1)
@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Enum, Boolean, ForeignKey, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Text, Enum, Boolean, ForeignKey, DateTime, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -6,16 +9,78 @@ from datetime import datetime
 import os
 import enum
 from dotenv import load_dotenv
+from db_metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool
 
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")  # Fallback to SQLite for local dev
 
-engine = create_engine(DATABASE_URL)
+# Connection pool settings, tuned per deployment via environment variables
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def get_db():
+    """Get database session with proper cleanup."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto the matching async driver"""
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg://", 1)
+    return url
+
+
+# Async engine for `async def` routes so DB I/O does not block the event loop
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_database_url(DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    """Async database session dependency"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_status() -> dict:
+    """Live connection pool metrics for the sync and async engines"""
+    return {
+        "sync": engine.pool.metrics.snapshot(engine.pool),
+        "async": async_engine.pool.metrics.snapshot(async_engine.pool),
+    }
 Base = declarative_base()
 
+
+def dialect_insert(bind):
+    """INSERT construct with on_conflict_do_update support for the bound dialect"""
+    if bind.dialect.name == "postgresql":
+        return postgresql_insert
+    return sqlite_insert
+
     # Enum for user roles
 class UserRole(enum.Enum): 
 
@@ -26,6 +91,7 @@ class UserRole(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_school", "school"),)
     id = Column(Integer, primary_key=True, index=True)
     phone = Column(String(15), unique=True, index=True)
     name = Column(String(100))
@@ -35,6 +101,12 @@ class User(Base):
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        Index("ix_attendance_district_subject", "district", "subject"),
+        Index("ix_attendance_subject", "subject"),
+        Index("ix_attendance_created_at", "created_at"),
+        Index("ix_attendance_district_created_at", "district", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     phone = Column(String(15), index=True)  
     students_present = Column(Integer)
@@ -42,11 +114,29 @@ class Attendance(Base):
     absence_reason = Column(Text)
     subject = Column(Text)   # renamed from topic_covered
     district = Column(String(100))  # new column added
+    created_at = Column(DateTime, default=datetime.utcnow)  # NULL for rows submitted before it existed
+
 
+class AttendanceRollup(Base):
+    """Running attendance totals per (school, district, subject), kept in step by crud"""
+    __tablename__ = "attendance_rollup"
+    __table_args__ = (UniqueConstraint("school", "district", "subject", name="uq_attendance_rollup_group"),)
+    id = Column(Integer, primary_key=True, index=True)
+    school = Column(String(100), nullable=False, default="")
+    district = Column(String(100), nullable=False, default="")
+    subject = Column(Text, nullable=False, default="")
+    records = Column(Integer, nullable=False, default=0)
+    students_present = Column(Integer, nullable=False, default=0)
+    students_absent = Column(Integer, nullable=False, default=0)
+    # Lowest User.id / Attendance.id in the group; masked labels are derived from
+    # these so they match /analytics/attendance and survive a rebuild
+    min_user_id = Column(Integer, nullable=True)
+    min_attendance_id = Column(Integer, nullable=True)
 
 
 class LessonPlan(Base):
     __tablename__ = "lesson_plans"
+    __table_args__ = (Index("ix_lesson_plans_phone_created_at", "phone", "created_at"),)
     
     id = Column(Integer, primary_key=True, index=True)
     phone = Column(String(15), index=True)
@@ -56,6 +146,46 @@ class LessonPlan(Base):
     spaces_file_path = Column(String(255))  # Path in Digital Ocean Spaces
     original_filename = Column(String(255))
     public_url = Column(String(500))  # Public URL for the image
+    thumbnail_url = Column(String(500), nullable=True)  # Small WebP rendition
+    medium_url = Column(String(500), nullable=True)  # Medium WebP rendition
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LessonPlanJob(Base):
+    """Queued /submit-lessonplan/ work: analyze the image, then render the PDF"""
+    __tablename__ = "lesson_plan_jobs"
+    __table_args__ = (Index("ix_lesson_plan_jobs_status_created_at", "status", "created_at"),)
+
+    id = Column(String(36), primary_key=True)  # uuid4, returned to the client
+    status = Column(String(20), default="queued")  # queued, running, done, failed
+    teacher_name = Column(String(100))
+    school = Column(String(100))
+    image_path = Column(String(255))  # Saved upload under lessonplans/uploads
+    pdf_filename = Column(String(255), nullable=True)  # Set once rendered; shared by identical jobs
+    score = Column(Integer, nullable=True)
+    caption = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class TableVersion(Base):
+    """Write counter per table, bumped by every create/update so list ETags change"""
+    __tablename__ = "table_versions"
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+
+class UploadedImage(Base):
+    """Content-hash index of lesson plan images already stored in Spaces"""
+    __tablename__ = "uploaded_images"
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    spaces_file_path = Column(String(255), nullable=False)
+    public_url = Column(String(500))
+    size = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -73,6 +203,10 @@ class DashboardUser(Base):
 
 class ExportRequest(Base):
     __tablename__ = "export_requests"
+    __table_args__ = (
+        Index("ix_export_requests_requester_status_created", "requester_id", "status", "created_at"),
+        Index("ix_export_requests_created_at", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     requester_id = Column(Integer, ForeignKey("dashboard_users.id"))
     requester_name = Column(String(100))
@@ -88,5 +222,4 @@ class ExportRequest(Base):
     # Relationship
     requester = relationship("DashboardUser")
 
-# Create tables (run once)
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# Tables and indexes are created by migrations.py at deploy time, not on import
\ No newline at end of file
@@ -0,0 +1,57 @@
+# pdf_render.py
+"""Lesson plan PDF pages.
+
+Kept free of app imports: these functions run inside cpu_pool workers.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from fpdf import FPDF
+
+logger = logging.getLogger(__name__)
+
+
+def generate_pdf(
+    pdf_path: str,
+    teacher_name: str,
+    school: str,
+    caption: str,
+    image_path: Optional[str] = None,
+    score: Optional[int] = None,
+    date: Optional[datetime] = None
+) -> None:
+    """Generate PDF with lesson plan details; date defaults to today"""
+    try:
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", size=12)
+        
+        # Header
+        pdf.cell(200, 10, txt="Enhanced Lesson Plan", ln=1, align='C')
+        pdf.cell(200, 10, txt=f"Teacher: {teacher_name}", ln=1)
+        pdf.cell(200, 10, txt=f"School: {school}", ln=1)
+        pdf.cell(200, 10, txt=f"Date: {(date or datetime.now()).strftime('%Y-%m-%d')}", ln=1)
+        if score is not None:
+            pdf.cell(200, 10, txt=f"Score: {score}/100", ln=1)
+        pdf.cell(200, 10, txt="Generated by: Dettol Hygiene Quest Program", ln=1)
+        
+        # Add image if available
+        if image_path and os.path.exists(image_path):
+            try:
+                image_y = pdf.get_y()
+                pdf.image(image_path, x=10, y=image_y, w=100)
+                pdf.set_y(image_y + 100)  # Position after image
+            except Exception as img_error:
+                logger.warning(f"Could not add image to PDF: {img_error}")
+                pdf.cell(200, 10, txt="[Image could not be embedded]", ln=1)
+        
+        # Feedback section
+        pdf.ln(10)  # Add some space
+        pdf.multi_cell(0, 10, txt=f"Feedback:\n{caption}")
+        
+        pdf.output(pdf_path)
+    except Exception as e:
+        logger.error(f"Error generating PDF: {e}")
+        raise
@@ -0,0 +1,152 @@
+# reports.py
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pypdf import PdfWriter
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth import get_current_user
+from cpu_pool import run_cpu_bound
+from masking import is_masked
+from models import LessonPlan, User, get_async_db
+from pdf_render import generate_pdf
+from spaces_storage import do_spaces
+from storage_manager import REPORTS_DIR, storage_manager
+
+logger = logging.getLogger(__name__)
+
+# Lesson plan images downloaded from Spaces at once while building a report
+REPORT_FETCH_CONCURRENCY = int(os.getenv("REPORT_FETCH_CONCURRENCY", "8"))
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+
+def report_cache_key(school: str, latest_id: int, plans: int, mask: bool) -> str:
+    """A report only changes when a plan is added to or removed from the school"""
+    return hashlib.sha256(
+        "\0".join((school, str(latest_id), str(plans), str(mask))).encode()
+    ).hexdigest()[:32]
+
+
+def merge_pdfs(page_paths: list, output_path: str) -> None:
+    writer = PdfWriter()
+    for path in page_paths:
+        writer.append(path)
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    writer.close()
+
+
+async def fetch_images(plans, work_dir: str) -> list:
+    """Download every plan's image from Spaces, a bounded number at a time"""
+    semaphore = asyncio.Semaphore(REPORT_FETCH_CONCURRENCY)
+
+    async def fetch(index, plan):
+        async with semaphore:
+            data = await do_spaces.download_file_async(plan.spaces_file_path)
+        if data is None:
+            return None
+        extension = os.path.splitext(plan.spaces_file_path)[1].lower()
+        image_path = os.path.join(work_dir, f"image_{index}{extension}")
+        await run_in_threadpool(write_file, image_path, data)
+        return image_path
+
+    return await asyncio.gather(*(fetch(i, plan) for i, plan in enumerate(plans)))
+
+
+def write_file(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def report_filename(school: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", school).strip("_") or "school"
+    return f"{safe}_lesson_plans.pdf"
+
+
+@router.post("/school/{school}")
+async def school_report(
+    school: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """One PDF with a page per lesson plan submitted by the school's teachers.
+
+    Images are fetched from Spaces concurrently and pages are rendered in the
+    CPU process pool, then merged. The result is reused until a plan is added
+    or removed. Teacher names are masked for restricted roles.
+    """
+    mask = is_masked(current_user["role"])
+    school_plans = (
+        select(LessonPlan, User.id.label("user_id"), User.name.label("teacher_name"))
+        .join(User, LessonPlan.phone == User.phone)
+        .where(User.school == school)
+    )
+
+    latest_id, plan_count = (await db.execute(
+        select(func.max(LessonPlan.id), func.count(LessonPlan.id))
+        .join(User, LessonPlan.phone == User.phone)
+        .where(User.school == school)
+    )).one()
+    if not plan_count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No lesson plans found for this school"
+        )
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    report_path = os.path.join(REPORTS_DIR, f"{report_cache_key(school, latest_id, plan_count, mask)}.pdf")
+
+    if os.path.exists(report_path):
+        storage_manager.touch(report_path)
+    else:
+        rows = (await db.execute(school_plans.order_by(LessonPlan.created_at, LessonPlan.id))).all()
+        work_dir = tempfile.mkdtemp(dir=REPORTS_DIR)
+        try:
+            image_paths = await fetch_images([row.LessonPlan for row in rows], work_dir)
+
+            page_paths = [os.path.join(work_dir, f"page_{i}.pdf") for i in range(len(rows))]
+            await asyncio.gather(*(
+                run_cpu_bound(
+                    generate_pdf,
+                    page_path,
+                    f"Teacher-{row.user_id:04d}" if mask else row.teacher_name,
+                    school,
+                    row.LessonPlan.feedback,
+                    image_path,
+                    score=row.LessonPlan.score,
+                    date=row.LessonPlan.created_at
+                )
+                for row, page_path, image_path in zip(rows, page_paths, image_paths)
+            ))
+
+            # Merge beside the target and rename, so readers never see a partial file
+            merged_path = os.path.join(work_dir, f"{uuid.uuid4().hex}.pdf")
+            await run_in_threadpool(merge_pdfs, page_paths, merged_path)
+            os.replace(merged_path, report_path)
+            storage_manager.track(report_path)
+            logger.info(f"Built report for {school}: {len(rows)} lesson plans")
+        except Exception as e:
+            logger.error(f"Failed to build report for {school}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to build school report: {str(e)}"
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return FileResponse(
+        report_path,
+        media_type="application/pdf",
+        filename=report_filename(school)
+    )
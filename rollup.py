@@ -0,0 +1,129 @@
+# rollup.py
+"""Maintenance of the attendance_rollup table.
+
+Usage: python rollup.py rebuild
+"""
+import sys
+from collections import defaultdict
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+from models import SessionLocal, Attendance, AttendanceRollup, User, dialect_insert
+
+
+def least(current, incoming):
+    """Smaller of two nullable columns (portable LEAST)"""
+    return case(
+        (current.is_(None), incoming),
+        (incoming.is_(None), current),
+        (incoming < current, incoming),
+        else_=current,
+    )
+
+
+def apply_attendance_rollup(db: Session, records, ids=None) -> None:
+    """Add attendance records to the rollup inside the caller's transaction.
+
+    ids gives the new Attendance ids when the records themselves carry none
+    (bulk inserts). Records whose phone has no registered user yet are skipped;
+    crud.create_user adds them when that phone registers.
+    """
+    records = list(records)
+    if not records:
+        return
+    if ids is None:
+        ids = [record.id for record in records]
+
+    phones = {record.phone for record in records}
+    users = {
+        phone: (user_id, school)
+        for phone, user_id, school in db.query(User.phone, User.id, User.school).filter(User.phone.in_(phones))
+    }
+
+    deltas = defaultdict(lambda: [0, 0, 0, None, None])
+    for record, attendance_id in zip(records, ids):
+        if record.phone not in users:
+            continue
+        user_id, school = users[record.phone]
+        key = (school or "", record.district or "", record.subject or "")
+        delta = deltas[key]
+        delta[0] += 1
+        delta[1] += record.students_present or 0
+        delta[2] += record.students_absent or 0
+        delta[3] = user_id if delta[3] is None else min(delta[3], user_id)
+        delta[4] = attendance_id if delta[4] is None else min(delta[4], attendance_id)
+
+    insert = dialect_insert(db.get_bind())
+    for (school, district, subject), (count, present, absent, user_id, attendance_id) in deltas.items():
+        stmt = insert(AttendanceRollup).values(
+            school=school,
+            district=district,
+            subject=subject,
+            records=count,
+            students_present=present,
+            students_absent=absent,
+            min_user_id=user_id,
+            min_attendance_id=attendance_id,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["school", "district", "subject"],
+            set_={
+                "records": AttendanceRollup.records + stmt.excluded.records,
+                "students_present": AttendanceRollup.students_present + stmt.excluded.students_present,
+                "students_absent": AttendanceRollup.students_absent + stmt.excluded.students_absent,
+                "min_user_id": least(AttendanceRollup.min_user_id, stmt.excluded.min_user_id),
+                "min_attendance_id": least(AttendanceRollup.min_attendance_id, stmt.excluded.min_attendance_id),
+            },
+        )
+        db.execute(stmt)
+
+
+def rebuild_attendance_rollup(db: Session, commit: bool = True) -> int:
+    """Recompute the rollup from raw attendance rows; returns the group count.
+
+    Migration 7 runs it once on deploy. Run it by hand while submissions are
+    quiet: rows written during the rebuild can be counted twice or missed
+    depending on commit order.
+    """
+    school = func.coalesce(User.school, "")
+    district = func.coalesce(Attendance.district, "")
+    subject = func.coalesce(Attendance.subject, "")
+    grouped = (
+        select(
+            school,
+            district,
+            subject,
+            func.count(Attendance.id),
+            func.coalesce(func.sum(Attendance.students_present), 0),
+            func.coalesce(func.sum(Attendance.students_absent), 0),
+            func.min(User.id),
+            func.min(Attendance.id),
+        )
+        .join(User, Attendance.phone == User.phone)
+        .group_by(school, district, subject)
+    )
+
+    db.query(AttendanceRollup).delete()
+    db.execute(
+        AttendanceRollup.__table__.insert().from_select(
+            [
+                "school", "district", "subject", "records", "students_present", "students_absent",
+                "min_user_id", "min_attendance_id",
+            ],
+            grouped,
+        )
+    )
+    if commit:
+        db.commit()
+    return db.query(func.count(AttendanceRollup.id)).scalar()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print(__doc__.strip())
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        groups = rebuild_attendance_rollup(db)
+        print(f"Rebuilt attendance rollup: {groups} groups")
+    finally:
+        db.close()
@@ -42,6 +42,7 @@ class Attendance(BaseModel):
     absence_reason: str
     subject: str
     district: str
+    created_at: Optional[datetime] = None
 
 
 # New schema for attendance with joined user data
@@ -56,6 +57,7 @@ class AttendanceWithUser(BaseModel):
     district: str
     teacher_name: str
     school: str
+    created_at: Optional[datetime] = None
 
 
 # Add to schemas.py or create new file export_schemas.py
@@ -101,6 +103,8 @@ class LessonPlan(BaseModel):
     spaces_file_path: str
     original_filename: str
     public_url: str
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     created_at: datetime
     teacher_name: Optional[str] = None
     school: Optional[str] = None
@@ -108,4 +112,34 @@ class LessonPlan(BaseModel):
  
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class LessonPlanUploadURLRequest(BaseModel):
+    """Request for a presigned direct-to-Spaces upload"""
+    filename: str
+    content_type: str
+
+
+class LessonPlanUploadComplete(BaseModel):
+    """Lesson plan details sent once the image is in Spaces"""
+    file_path: str
+    upload_token: str  # From /lessonplan/upload-url, ties the key to an issued form
+    original_filename: str
+    phone: str
+    score: int
+    subject: str
+    feedback: str
+
+
+class LessonPlanJob(BaseModel):
+    """Status of a queued lesson plan submission"""
+    job_id: str
+    status: str
+    score: Optional[int] = None
+    caption: Optional[str] = None
+    download_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
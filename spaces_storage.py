@@ -1,15 +1,60 @@
 # spaces_storage.py
+import asyncio
+import hashlib
+import hmac
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import NoCredentialsError, ClientError
 import uuid
 import logging
+import time
 from datetime import datetime
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+MB = 1024 * 1024
+
+# Uploads larger than the threshold go up as S3 multipart uploads in chunks,
+# so at most chunksize * concurrency bytes of a file are buffered at once
+SPACES_MULTIPART_THRESHOLD = int(os.getenv("SPACES_MULTIPART_THRESHOLD_MB", "8")) * MB
+SPACES_MULTIPART_CHUNKSIZE = int(os.getenv("SPACES_MULTIPART_CHUNKSIZE_MB", "8")) * MB
+SPACES_MULTIPART_CONCURRENCY = int(os.getenv("SPACES_MULTIPART_CONCURRENCY", "4"))
+
+# Largest lesson plan image accepted
+MAX_UPLOAD_BYTES = int(os.getenv("LESSONPLAN_MAX_UPLOAD_MB", "15")) * MB
+
+# Threads reserved for blocking boto3 calls made from async routes; this is
+# also the cap on concurrent Spaces operations per worker
+SPACES_MAX_WORKERS = int(os.getenv("SPACES_MAX_WORKERS", "8"))
+
+# How long a presigned direct-upload form stays valid
+PRESIGNED_UPLOAD_EXPIRY_SECONDS = int(os.getenv("PRESIGNED_UPLOAD_EXPIRY_SECONDS", "900"))
+
+# How long after its form expires an upload may still be completed
+UPLOAD_COMPLETE_GRACE_SECONDS = int(os.getenv("UPLOAD_COMPLETE_GRACE_SECONDS", "3600"))
+
+# Keys generated by _object_key; rendition keys (<uuid>_thumb.webp) never match
+ORIGINAL_KEY_PATTERN = re.compile(r"^lesson_plans/\d{4}/\d{2}/\d{2}/[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}\.[a-z]+$")
+
+# Allow common image formats
+ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp", ".svg"}
+
+
+def sha256_fileobj(fileobj, chunk_size=MB):
+    """SHA-256 hex digest of a seekable file, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
 
 class DigitalOceanSpaces:
     def __init__(self):
@@ -17,7 +62,8 @@ class DigitalOceanSpaces:
         self.secret_key = os.getenv("DO_SPACES_SECRET_KEY")
         self.region = os.getenv("DO_SPACES_REGION", "sfo3")
         self.bucket_name = os.getenv("DO_SPACES_BUCKET", "lessonplanhygienequest")
-        self.endpoint_url = f"https://{self.region}.digitaloceanspaces.com"
+        # Override to point at a local S3 stand-in (e.g. moto) during development
+        self.endpoint_url = os.getenv("DO_SPACES_ENDPOINT_URL", f"https://{self.region}.digitaloceanspaces.com")
 
         if not self.access_key or not self.secret_key:
             raise ValueError("❌ DigitalOcean Spaces credentials not found in environment variables")
@@ -30,25 +76,44 @@ class DigitalOceanSpaces:
                 aws_secret_access_key=self.secret_key,
                 region_name=self.region,
             )
+            self.transfer_config = TransferConfig(
+                multipart_threshold=SPACES_MULTIPART_THRESHOLD,
+                multipart_chunksize=SPACES_MULTIPART_CHUNKSIZE,
+                max_concurrency=SPACES_MULTIPART_CONCURRENCY,
+            )
+            self._executor = ThreadPoolExecutor(
+                max_workers=SPACES_MAX_WORKERS, thread_name_prefix="spaces"
+            )
+            self._metrics_lock = threading.Lock()
+            self._queued = 0
+            self._running = 0
+            self._completed = 0
+            self._max_queue_depth = 0
             logger.info("✅ Connected to DigitalOcean Spaces successfully")
         except Exception as e:
             logger.error(f"❌ Failed to initialize DigitalOcean Spaces client: {str(e)}")
             raise
 
+    def _object_key(self, filename):
+        """Date-organized unique key for an image, or None if the type is not allowed"""
+        file_extension = os.path.splitext(filename)[1].lower()
+        if file_extension not in ALLOWED_EXTENSIONS:
+            return None, file_extension
+
+        # Organize by date
+        date_path = datetime.utcnow().strftime("%Y/%m/%d")
+        return f"lesson_plans/{date_path}/{uuid.uuid4()}{file_extension}", file_extension
+
+    def public_url_for(self, file_path):
+        return f"https://{self.bucket_name}.{self.region}.digitaloceanspaces.com/{file_path}"
+
     def upload_file(self, file_content, filename, content_type=None):
         """Upload an image to Digital Ocean Spaces (public)"""
         try:
-            file_extension = os.path.splitext(filename)[1].lower()
-
-            # Allow common image formats
-            allowed_extensions = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp", ".svg"}
-            if file_extension not in allowed_extensions:
+            unique_filename, file_extension = self._object_key(filename)
+            if unique_filename is None:
                 return {"success": False, "error": f"File type '{file_extension}' not allowed"}
 
-            # Organize by date
-            date_path = datetime.utcnow().strftime("%Y/%m/%d")
-            unique_filename = f"lesson_plans/{date_path}/{uuid.uuid4()}{file_extension}"
-
             # Upload with public-read ACL
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
@@ -58,7 +123,7 @@ class DigitalOceanSpaces:
                 ACL="public-read",
             )
 
-            public_url = f"https://{self.bucket_name}.{self.region}.digitaloceanspaces.com/{unique_filename}"
+            public_url = self.public_url_for(unique_filename)
             logger.info(f"✅ Uploaded file '{filename}' → {public_url}")
 
             return {
@@ -78,6 +143,72 @@ class DigitalOceanSpaces:
             logger.error(f"❌ Unexpected error during upload: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    def upload_fileobj(self, fileobj, filename, content_type=None):
+        """Stream a file-like object to Spaces (public), multipart above the threshold"""
+        try:
+            unique_filename, file_extension = self._object_key(filename)
+            if unique_filename is None:
+                return {"success": False, "error": f"File type '{file_extension}' not allowed"}
+
+            self.s3_client.upload_fileobj(
+                fileobj,
+                self.bucket_name,
+                unique_filename,
+                ExtraArgs={
+                    "ContentType": content_type or "application/octet-stream",
+                    "ACL": "public-read",
+                },
+                Config=self.transfer_config,
+            )
+
+            public_url = self.public_url_for(unique_filename)
+            logger.info(f"✅ Streamed file '{filename}' → {public_url}")
+
+            return {
+                "success": True,
+                "file_path": unique_filename,
+                "public_url": public_url,
+                "filename": filename,
+            }
+
+        except NoCredentialsError:
+            logger.error("❌ Upload failed: Credentials not available")
+            return {"success": False, "error": "Credentials not available"}
+        except ClientError as e:
+            logger.error(f"❌ Upload failed: {str(e)}")
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"❌ Unexpected error during upload: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def put_bytes(self, file_path, content, content_type):
+        """Store bytes (public) under an exact key, e.g. a rendition next to its original"""
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=file_path,
+                Body=content,
+                ContentType=content_type,
+                ACL="public-read",
+            )
+            return {"success": True, "file_path": file_path, "public_url": self.public_url_for(file_path)}
+        except Exception as e:
+            logger.error(f"❌ Failed to store {file_path}: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def download_file(self, file_path, max_bytes=MAX_UPLOAD_BYTES):
+        """Object contents, or None if missing or larger than max_bytes"""
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=file_path)
+            if obj["ContentLength"] > max_bytes:
+                logger.warning(f"⚠️ {file_path} is larger than {max_bytes} bytes; not downloading")
+                obj["Body"].close()
+                return None
+            return obj["Body"].read()
+        except Exception as e:
+            logger.error(f"❌ Failed to download {file_path}: {str(e)}")
+            return None
+
     def generate_presigned_url(self, file_path, expiration_hours=1):
         """Generate a presigned URL for temporary access (optional if public)"""
         try:
@@ -91,6 +222,76 @@ class DigitalOceanSpaces:
             logger.error(f"❌ Failed to generate presigned URL: {str(e)}")
             return None
 
+    def generate_presigned_upload(self, filename, content_type, max_size=MAX_UPLOAD_BYTES,
+                                  expiration_seconds=PRESIGNED_UPLOAD_EXPIRY_SECONDS):
+        """Presigned POST letting a client upload one image straight to Spaces"""
+        try:
+            unique_filename, file_extension = self._object_key(filename)
+            if unique_filename is None:
+                return {"success": False, "error": f"File type '{file_extension}' not allowed"}
+            if not content_type or not content_type.startswith("image/"):
+                return {"success": False, "error": "Only image uploads are allowed"}
+
+            expires_at = int(time.time()) + expiration_seconds + UPLOAD_COMPLETE_GRACE_SECONDS
+            presigned = self.s3_client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=unique_filename,
+                Fields={"acl": "public-read", "Content-Type": content_type},
+                Conditions=[
+                    {"acl": "public-read"},
+                    {"Content-Type": content_type},
+                    ["content-length-range", 1, max_size],
+                ],
+                ExpiresIn=expiration_seconds,
+            )
+            return {
+                "success": True,
+                "upload_url": presigned["url"],
+                "fields": presigned["fields"],
+                "file_path": unique_filename,
+                "upload_token": self.sign_upload_key(unique_filename, expires_at),
+                "public_url": self.public_url_for(unique_filename),
+                "expires_in": expiration_seconds,
+                "max_size": max_size,
+            }
+        except Exception as e:
+            logger.error(f"❌ Failed to generate presigned upload: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def _upload_signature(self, file_path, expires_at):
+        secret = os.getenv("UPLOAD_TOKEN_SECRET") or self.secret_key
+        message = f"{file_path}:{expires_at}".encode()
+        return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def sign_upload_key(self, file_path, expires_at):
+        """Token proving the API issued an upload form for this key"""
+        return f"{expires_at}.{self._upload_signature(file_path, expires_at)}"
+
+    def verify_upload_token(self, file_path, token):
+        """True if token was issued for file_path, has not expired, and the key is an original"""
+        if not ORIGINAL_KEY_PATTERN.match(file_path or ""):
+            return False
+        expires_at, _, signature = (token or "").partition(".")
+        if not expires_at.isdigit() or int(expires_at) < time.time():
+            return False
+        return hmac.compare_digest(signature, self._upload_signature(file_path, int(expires_at)))
+
+    def head_file(self, file_path):
+        """Size and content type of an object, or success=False if it does not exist"""
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=file_path)
+            return {
+                "success": True,
+                "size": head["ContentLength"],
+                "content_type": head.get("ContentType"),
+            }
+        except ClientError as e:
+            logger.warning(f"⚠️ HEAD failed for {file_path}: {str(e)}")
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"❌ Unexpected error reading {file_path}: {str(e)}")
+            return {"success": False, "error": str(e)}
+
     def delete_file(self, file_path):
         """Delete a file from Digital Ocean Spaces"""
         try:
@@ -104,6 +305,70 @@ class DigitalOceanSpaces:
             logger.error(f"❌ Unexpected error deleting file {file_path}: {str(e)}")
             return False
 
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking boto3 call on the Spaces thread pool, tracking queue depth"""
+        started = False
+
+        def task():
+            nonlocal started
+            with self._metrics_lock:
+                started = True
+                self._queued -= 1
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._metrics_lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        with self._metrics_lock:
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, task)
+        except asyncio.CancelledError:
+            # A job cancelled before a thread picked it up never leaves the queue itself
+            with self._metrics_lock:
+                if not started:
+                    self._queued -= 1
+            raise
+
+    async def upload_fileobj_async(self, fileobj, filename, content_type=None):
+        return await self._run(self.upload_fileobj, fileobj, filename, content_type=content_type)
+
+    async def upload_file_async(self, file_content, filename, content_type=None):
+        return await self._run(self.upload_file, file_content, filename, content_type=content_type)
+
+    async def sha256_fileobj_async(self, fileobj):
+        return await self._run(sha256_fileobj, fileobj)
+
+    async def put_bytes_async(self, file_path, content, content_type):
+        return await self._run(self.put_bytes, file_path, content, content_type)
+
+    async def download_file_async(self, file_path, max_bytes=MAX_UPLOAD_BYTES):
+        return await self._run(self.download_file, file_path, max_bytes)
+
+    async def head_file_async(self, file_path):
+        return await self._run(self.head_file, file_path)
+
+    async def delete_file_async(self, file_path):
+        return await self._run(self.delete_file, file_path)
+
+    def metrics(self):
+        """Thread pool usage for Spaces operations"""
+        with self._metrics_lock:
+            return {
+                "max_workers": SPACES_MAX_WORKERS,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "max_queue_depth": self._max_queue_depth,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
 
 # Singleton instance
 do_spaces = DigitalOceanSpaces()
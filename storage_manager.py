@@ -0,0 +1,214 @@
+# storage_manager.py
+"""Retention for the local lessonplans/ working directories.
+
+Uploads, generated PDFs and school reports are indexed with their size and
+last use (write or download). A background sweep deletes files unused for
+longer than the max age, then evicts least-recently-used files until the
+directories fit the byte budget. Files still needed by a queued job are
+pinned and never evicted.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "lessonplans/uploads"
+GENERATED_DIR = "lessonplans/generated"
+REPORTS_DIR = "lessonplans/reports"
+
+MB = 1024 * 1024
+
+LESSONPLAN_STORAGE_BUDGET_BYTES = int(os.getenv("LESSONPLAN_STORAGE_BUDGET_MB", "1024")) * MB
+LESSONPLAN_STORAGE_MAX_AGE_SECONDS = int(os.getenv("LESSONPLAN_STORAGE_MAX_AGE_HOURS", "168")) * 3600
+LESSONPLAN_STORAGE_SWEEP_SECONDS = int(os.getenv("LESSONPLAN_STORAGE_SWEEP_SECONDS", "300"))
+
+
+class StorageManager:
+    def __init__(self, directories, budget_bytes: int, max_age_seconds: int, sweep_seconds: int):
+        self.directories = list(directories)
+        self.budget_bytes = budget_bytes
+        self.max_age_seconds = max_age_seconds
+        self.sweep_seconds = sweep_seconds
+        self._files = {}  # path -> [size, last_used]
+        self._pinned = {}  # path -> pin count
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.expired = 0
+        self.sweeps = 0
+        self.last_sweep_at: Optional[datetime] = None
+
+    def _used_bytes(self) -> int:
+        return sum(size for size, _ in self._files.values())
+
+    def track(self, path: str) -> None:
+        """Record a newly written file (or a rewrite) as just used"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            self._files[path] = [size, time.time()]
+            over_budget = self._used_bytes() > self.budget_bytes
+        if over_budget and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def touch(self, path: str) -> None:
+        """Mark a file as used now, e.g. when it is downloaded or reused"""
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is not None:
+                entry[1] = time.time()
+                return
+        self.track(path)
+
+    def pin(self, path: str) -> None:
+        with self._lock:
+            self._pinned[path] = self._pinned.get(path, 0) + 1
+
+    def unpin(self, path: str) -> None:
+        with self._lock:
+            count = self._pinned.get(path, 0) - 1
+            if count > 0:
+                self._pinned[path] = count
+            else:
+                self._pinned.pop(path, None)
+
+    def _scan(self) -> None:
+        """Reconcile the index with the directories; unknown files start at their mtime"""
+        found = {}
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Skip in-progress renders (*.tmp files, report work dirs)
+                    if not entry.is_file() or entry.name.endswith(".tmp"):
+                        continue
+                    stat = entry.stat()
+                    found[entry.path] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            for path in list(self._files):
+                if path not in found:
+                    del self._files[path]
+            for path, (size, mtime) in found.items():
+                entry = self._files.get(path)
+                if entry is None:
+                    self._files[path] = [size, mtime]
+                else:
+                    entry[0] = size
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not evict {path}: {e}")
+            return False
+        return True
+
+    def sweep(self) -> None:
+        """Expire old files, then evict least recently used ones until under budget"""
+        self._scan()
+        # Victims leave the index under the lock; the deletes happen after it is
+        # released, so touch()/track() on the event loop never wait on disk I/O
+        victims = []
+        with self._lock:
+            cutoff = time.time() - self.max_age_seconds
+            candidates = sorted(
+                (last_used, path) for path, (_, last_used) in self._files.items()
+                if path not in self._pinned
+            )
+            used = self._used_bytes()
+            for last_used, path in candidates:
+                expired = last_used < cutoff
+                if not expired and used <= self.budget_bytes:
+                    break
+                size, _ = self._files.pop(path)
+                used -= size
+                victims.append((path, size, expired))
+
+        removed = []
+        for path, size, expired in victims:
+            with self._lock:
+                # Rewritten or pinned again since it was picked; keep it
+                if path in self._files or path in self._pinned:
+                    continue
+            if self._remove(path):
+                removed.append((size, expired))
+        with self._lock:
+            for size, expired in removed:
+                self.evictions += 1
+                self.evicted_bytes += size
+                if expired:
+                    self.expired += 1
+            self.sweeps += 1
+            self.last_sweep_at = datetime.utcnow()
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                await run_in_threadpool(self.sweep)
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.sweep_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._loop = None
+
+    def metrics(self):
+        """Disk usage per directory and eviction counters"""
+        with self._lock:
+            per_directory = {directory: {"files": 0, "bytes": 0} for directory in self.directories}
+            for path, (size, _) in self._files.items():
+                usage = per_directory.get(os.path.dirname(path))
+                if usage is not None:
+                    usage["files"] += 1
+                    usage["bytes"] += size
+            return {
+                "budget_bytes": self.budget_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "used_bytes": self._used_bytes(),
+                "files": len(self._files),
+                "pinned": len(self._pinned),
+                "directories": per_directory,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "expired": self.expired,
+                "sweeps": self.sweeps,
+                "last_sweep_at": self.last_sweep_at,
+            }
+
+
+# Singleton instance
+storage_manager = StorageManager(
+    (UPLOAD_DIR, GENERATED_DIR, REPORTS_DIR),
+    budget_bytes=LESSONPLAN_STORAGE_BUDGET_BYTES,
+    max_age_seconds=LESSONPLAN_STORAGE_MAX_AGE_SECONDS,
+    sweep_seconds=LESSONPLAN_STORAGE_SWEEP_SECONDS,
+)
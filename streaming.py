@@ -0,0 +1,84 @@
+# streaming.py
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from models import SessionLocal
+
+# Rows fetched per round trip from the server-side cursor
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+STREAM_FORMATS = ("ndjson", "csv")
+FORMAT_PATTERN = "^(json|ndjson|csv)$"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _iter_rows(build_query: Callable[[Session], object], to_dict: Callable) -> Iterator[dict]:
+    """Yield dicts from a query using a server-side cursor.
+
+    The session is opened here rather than taken from the request dependency,
+    because the body is produced after the endpoint has returned.
+    """
+    db = SessionLocal()
+    try:
+        query = build_query(db).execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+        for row in query:
+            yield to_dict(row)
+    finally:
+        db.close()
+
+
+def _ndjson_lines(rows: Iterable[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, default=_json_default) + "\n"
+
+
+def column_names(columns) -> List[str]:
+    """Result keys of a column projection, in SELECT order"""
+    return [column.key for column in columns]
+
+
+def _csv_lines(rows: Iterable[dict], fieldnames: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    # Header first, so an empty result is still a valid CSV with its columns
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def stream_query(
+    build_query: Callable[[Session], object],
+    to_dict: Callable,
+    fmt: str,
+    filename: str,
+    fieldnames: List[str],
+    headers: Optional[dict] = None
+) -> StreamingResponse:
+    """Stream query rows as NDJSON or CSV without materializing the result.
+
+    fieldnames are the keys of the dicts made by to_dict, used as the CSV header.
+    """
+    rows = _iter_rows(build_query, to_dict)
+    headers = dict(headers or {})
+    if fmt == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return StreamingResponse(_csv_lines(rows, fieldnames), media_type="text/csv", headers=headers)
+    return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson", headers=headers)
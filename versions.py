@@ -0,0 +1,61 @@
+# versions.py
+"""Cheap per-table change versions used for ETag / If-None-Match handling.
+
+A table's version is its max id plus a write counter in table_versions.
+Inserts move the max id; the counter also catches updates and deletes.
+"""
+import hashlib
+from fastapi import Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import TableVersion, dialect_insert
+
+
+def _bump_statement(bind, table_name: str):
+    insert = dialect_insert(bind)
+    stmt = insert(TableVersion).values(table_name=table_name, version=1)
+    return stmt.on_conflict_do_update(
+        index_elements=["table_name"],
+        set_={"version": TableVersion.version + 1},
+    )
+
+
+def bump_version(db: Session, *table_names: str) -> None:
+    """Bump write counters inside the caller's transaction (commit is up to the caller)"""
+    for table_name in table_names:
+        db.execute(_bump_statement(db.get_bind(), table_name))
+
+
+async def bump_version_async(db: AsyncSession, *table_names: str) -> None:
+    """Async-session variant of bump_version"""
+    for table_name in table_names:
+        await db.execute(_bump_statement(db.bind, table_name))
+
+
+def current_versions(db: Session, *models) -> tuple:
+    """(max id, write counter) for each model, fetched in a single round trip"""
+    columns = []
+    for model in models:
+        columns.append(select(func.max(model.id)).scalar_subquery())
+        columns.append(
+            select(TableVersion.version)
+            .where(TableVersion.table_name == model.__tablename__)
+            .scalar_subquery()
+        )
+    return tuple(db.execute(select(*columns)).one())
+
+
+def compute_etag(db: Session, request: Request, models, role=None) -> str:
+    """ETag for a list response: table versions + caller role + query string"""
+    role_name = role.value if role is not None else "public"
+    key = f"{request.url.path}?{request.url.query}|{role_name}|{current_versions(db, *models)}"
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates